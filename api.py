@@ -0,0 +1,299 @@
+# ----------------------------------------------------------------------------#
+# JSON API.
+# ----------------------------------------------------------------------------#
+# /api/v1 serves the same query functions as the HTML views, as JSON. Every
+# response carries a strong ETag built from the versions of the rows behind
+# it. Listings and searches use the per-table counters in TableVersion
+# (models.py), a primary key lookup per table. Detail endpoints, which cover
+# one entity's rows, use per table COUNT (which catches deletes) and
+# MAX(updated_at) (inserts and updates) of those rows. Wherever upcoming/past
+# counts are included, the start of the next show is part of it too, since
+# those change when it starts. One index-backed statement computes the
+# version, so a client polling with If-None-Match gets its 304 before any
+# data is loaded or serialized.
+import hashlib
+import json
+from datetime import date, datetime, timedelta
+from functools import partial
+
+import pytz
+from flask import Blueprint, Response, abort, current_app, request
+
+from availability import booking_index
+from bookings import book_shows, parse_start_time
+from models import db, Venue, Artist, Show, TableVersion, normalize_genres, venue_genres, artist_genres
+from partitions import history_window
+from queries import PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, show_page, artist_page, artist_search, \
+    artist_detail, venue_page, venue_search, venue_detail
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+#  Encoding
+#  ----------------------------------------------------------------
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(payload):
+    # orjson when it is installed; it writes datetimes natively, in the same
+    # ISO 8601 form as the fallback.
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, default=_default, separators=(',', ':')).encode()
+
+
+#  Versions
+#  ----------------------------------------------------------------
+
+def rows_version(model, *criteria, via=None):
+    # (count, MAX(updated_at)) of model's rows matching criteria; `via` joins
+    # them through a relationship first.
+    name = model.__tablename__
+    query = db.session.query(
+        db.func.count(model.id).label(f'{name}_rows'),
+        db.func.max(model.updated_at).label(f'{name}_updated_at'),
+    )
+    if via is not None:
+        query = query.select_from(via.parent.class_).join(via)
+    return query.filter(*criteria)
+
+
+def table_version(model):
+    # The version counter of model's whole table.
+    name = model.__tablename__
+    return db.session.query(
+        TableVersion.version.label(f'{name}_version'),
+        TableVersion.updated_at.label(f'{name}_updated_at'),
+    ).filter(TableVersion.name == name)
+
+
+def next_show(now, *criteria):
+    return db.session.query(db.func.min(Show.start_time).label('next_show')) \
+        .filter(Show.start_time > now, *criteria)
+
+
+def version(*parts):
+    # Runs the parts as one statement; returns (row, last_modified).
+    row = db.session.query(*[part.subquery() for part in parts]).one()
+    updated = [value for key, value in zip(row.keys(), row) if key.endswith('_updated_at') and value]
+    return row, max(updated, default=None)
+
+
+def conditional(current, load, key=()):
+    # 304 if the client holds the current version, else load()'s payload.
+    # key: anything else the payload depends on.
+    row, last_modified = current
+    etag = hashlib.sha1(repr(tuple(row) + tuple(key)).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(dumps(load()), mimetype='application/json')
+    response.set_etag(etag)
+    # Clients may keep the body but must revalidate before every use.
+    response.headers['Cache-Control'] = 'no-cache'
+    if last_modified is not None:
+        # Informational only: a delete leaves MAX(updated_at) unchanged, so
+        # If-Modified-Since alone could serve a stale copy.
+        response.last_modified = last_modified
+    return response
+
+
+def page_args():
+    after = request.args.get('after')
+    limit = min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE)
+    if limit < 1:
+        abort(400)
+    if after:
+        try:
+            decode_cursor(after)
+        except ValueError:
+            abort(400)
+    return after, limit
+
+
+def listing(page, after, limit):
+    try:
+        rows, next_cursor = page(after=after, limit=limit)
+    except ValueError:
+        # A cursor that decodes but doesn't fit the listing's key.
+        abort(400)
+    return {"data": [row._asdict() for row in rows], "next": next_cursor}
+
+
+def genre_listing(page, genre_index, after, limit):
+    # ?genre= (repeatable) filters as on the HTML listings; "genres" holds
+    # the facet counts for that selection, on the first page only.
+    genres = normalize_genres(request.args.getlist('genre'))
+    payload = listing(partial(page, genres=genres), after, limit)
+    if not after:
+        payload["genres"] = dict(genre_index.facets(genres))
+    return payload
+
+
+def search(find):
+    # ?q=<term>, optional ?limit= and ?prefix=1, as on the HTML search forms.
+    data = [row._asdict() for row in find(
+        request.args.get('q', ''),
+        limit=request.args.get('limit', type=int),
+        prefix=bool(request.args.get('prefix')),
+    )]
+    return {"count": len(data), "data": data}
+
+
+def window_criteria(criterion, since):
+    # Criteria for the shows a detail payload lists: those from `since` on
+    # (the recent history window), or all of them with ?history=all, as on
+    # the HTML pages. The window moves monthly, so it goes into the ETag too.
+    return [criterion] if since is None else [criterion, Show.start_time >= since]
+
+
+def detail(load, entity_id, now, since):
+    data = load(entity_id, now, since)
+    if data is None:
+        abort(404)
+    return data
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@api.route('/venues')
+def venues():
+    after, limit = page_args()
+    current = version(table_version(Venue), table_version(Show), next_show(datetime.now()))
+    return conditional(current, lambda: genre_listing(venue_page, venue_genres, after, limit))
+
+
+@api.route('/venues/search')
+def search_venues():
+    current = version(table_version(Venue), table_version(Show), next_show(datetime.now()))
+    return conditional(current, lambda: search(venue_search))
+
+
+@api.route('/venues/<int:venue_id>')
+def show_venue(venue_id):
+    now = datetime.now()
+    since = history_window(now)
+    shows = window_criteria(Show.venue_id == venue_id, since)
+    current = version(
+        rows_version(Venue, Venue.id == venue_id),
+        rows_version(Show, *shows),
+        rows_version(Artist, *shows, via=Show.artist),
+        next_show(now, Show.venue_id == venue_id),
+    )
+    if not current[0].Venue_rows:
+        abort(404)
+    return conditional(current, lambda: detail(venue_detail, venue_id, now, since), (since,))
+
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@api.route('/artists')
+def artists():
+    after, limit = page_args()
+    return conditional(version(table_version(Artist)),
+                       lambda: genre_listing(artist_page, artist_genres, after, limit))
+
+
+@api.route('/artists/search')
+def search_artists():
+    current = version(table_version(Artist), table_version(Show), next_show(datetime.now()))
+    return conditional(current, lambda: search(artist_search))
+
+
+@api.route('/artists/<int:artist_id>')
+def show_artist(artist_id):
+    now = datetime.now()
+    since = history_window(now)
+    shows = window_criteria(Show.artist_id == artist_id, since)
+    current = version(
+        rows_version(Artist, Artist.id == artist_id),
+        rows_version(Show, *shows),
+        rows_version(Venue, *shows, via=Show.venue),
+        next_show(now, Show.artist_id == artist_id),
+    )
+    if not current[0].Artist_rows:
+        abort(404)
+    return conditional(current, lambda: detail(artist_detail, artist_id, now, since), (since,))
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@api.route('/shows')
+def shows():
+    after, limit = page_args()
+    current = version(table_version(Show), table_version(Venue), table_version(Artist))
+    return conditional(current, lambda: listing(show_page, after, limit))
+
+
+@api.route('/shows/batch', methods=['POST'])
+def create_shows():
+    # Body: a list of {"artist_id", "venue_id", "start_time"} objects, or
+    # {"shows": [...]}. ?partial=1 lists the valid rows when others fail.
+    payload = request.get_json(silent=True)
+    records = payload.get('shows') if isinstance(payload, dict) else payload
+    if not isinstance(records, list):
+        abort(400, 'Expected a JSON list of shows.')
+    created, errors = book_shows(records, partial=bool(request.args.get('partial')))
+    status = 201 if created else 422 if errors else 200
+    return Response(dumps({"created": created, "errors": errors}), status=status,
+                    mimetype='application/json')
+
+
+#  Availability
+#  ----------------------------------------------------------------
+
+# Bounds on one availability request.
+AVAILABILITY_MAX_IDS = 50
+AVAILABILITY_MAX_DAYS = 366
+
+
+def availability_range():
+    zone = pytz.timezone(current_app.config.get('TIMEZONE', 'UTC'))
+    try:
+        start = parse_start_time(request.args['start'], zone) if 'start' in request.args else datetime.now()
+        end = parse_start_time(request.args['end'], zone) if 'end' in request.args else start + timedelta(days=30)
+    except ValueError:
+        abort(400, 'start and end must be ISO 8601 dates or times.')
+    if not start < end <= start + timedelta(days=AVAILABILITY_MAX_DAYS):
+        abort(400, f'end must be after start, by at most {AVAILABILITY_MAX_DAYS} days.')
+    return start, end
+
+
+@api.route('/availability')
+def availability():
+    # ?venue=<id> and ?artist=<id> (each repeatable), ?start= and ?end=
+    # (default: the next 30 days). Served from the in-memory booking index
+    # (see availability.py), so it carries no ETag.
+    ids = {kind: request.args.getlist(kind, type=int) for kind in ('venue', 'artist')}
+    if not any(ids.values()) or sum(map(len, ids.values())) > AVAILABILITY_MAX_IDS:
+        abort(400, f'Give between 1 and {AVAILABILITY_MAX_IDS} venue and artist ids.')
+    start, end = availability_range()
+    payload = {"start": start, "end": end, "show_duration": int(booking_index.duration.total_seconds() // 60)}
+    for kind, model in (('venue', Venue), ('artist', Artist)):
+        if ids[kind]:
+            found = {id for id, in db.session.query(model.id).filter(model.id.in_(ids[kind]))}
+            missing = [id for id in ids[kind] if id not in found]
+            if missing:
+                abort(404, f'There is no {kind} {missing[0]}.')
+        slots = booking_index.availability(kind, list(dict.fromkeys(ids[kind])), start, end)
+        payload[f'{kind}s'] = [dict(id=id, **slots[id]) for id in slots]
+    return Response(dumps(payload), mimetype='application/json')
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+    return Response(dumps({"error": error.description}), status=error.code,
+                    mimetype='application/json')
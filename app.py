@@ -1,40 +1,145 @@
 # ----------------------------------------------------------------------------#
 # Imports
 # ----------------------------------------------------------------------------#
-from email.policy import default
-import json
-from math import fabs
-from urllib import response
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
-from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
+import os
+from datetime import datetime
+from functools import partial
 from logging import Formatter, FileHandler
-from flask_wtf import FlaskForm as Form
-from forms import *
-from flask_migrate import Migrate
-# from models import Venue, Artist, Show
-from models import *
+
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, \
+    jsonify, stream_with_context, current_app
+
+from forms import VenueForm, ArtistForm, ShowForm
+from models import db, Venue, Artist, Show, TableVersion, normalize_genres, venue_genres, artist_genres
+from assets import Assets
+from availability import booking_index
+from cache import cache
+from jobs import jobs
+from metrics import metrics
+from cli import fyyur_cli
+from routing import ReplicaRouter, read_only
+from profiling import SQLProfiler
+from formatting import DateFormatter
+from fragments import FragmentCache
+from api import api
+from bookings import book_shows
+import summary  # registers the VenueSummary refresh on flush
+from partitions import history_since, history_window
+from queries import PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, iter_keyset, show_page, artist_page, artist_search, \
+    artist_detail, venue_page, venue_search, venue_detail, group_areas
 
 # ----------------------------------------------------------------------------#
 # App Config.
 # ----------------------------------------------------------------------------#
-
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db.init_app(app)
-# migrate = Migrate(app, db)
-db.create_all()
-
-# DONE: connect to a local postgresql database
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://postgres@localhost:5432/fyyurdb'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# create_app() builds and configures the application. Importing this module
+# only defines it, so the web workers (wsgi.py), the flask CLI and tools
+# each create their own app. Extensions are created unbound and initialized
+# on it.
+
+replicas = ReplicaRouter()
+profiler = SQLProfiler()
+fragments = FragmentCache()
+assets = Assets()
+# `datetime` is registered by the formatter; listings preformat their show
+# times in one batch before rendering (see formatting.py).
+formatter = DateFormatter()
+
+# Views are declared with @route and added to the app by create_app(),
+# under their function names as endpoints.
+views = []
+
+
+def route(rule, **options):
+    def register(view):
+        views.append((rule, view, options))
+        return view
+    return register
+
+
+# Cache-warming job hooks, declared with @warms; create_app() subscribes
+# them when the page cache is shared between processes.
+warm_hooks = []
+
+
+def warms(*events):
+    def register(handler):
+        warm_hooks.append((events, handler))
+        return handler
+    return register
+
+
+def create_app(config='config'):
+    app = Flask(__name__)
+    # Database URL, pool sizing and timeouts all come from config.py, so they
+    # must be in place before db.init_app.
+    app.config.from_object(config)
+    db.init_app(app)
+    replicas.init_app(app)
+    profiler.init_app(app)
+    metrics.init_app(app)
+    cache.init_app(app)
+    booking_index.init_app(app)
+    jobs.init_app(app)
+    if cache.shared:
+        # Warming a per-process cache would mostly fill one that the readers,
+        # in other processes, never hit.
+        for events, handler in warm_hooks:
+            jobs.hook(*events)(handler)
+    fragments.init_app(app)
+    assets.init_app(app)
+    formatter.init_app(app)
+    app.cli.add_command(fyyur_cli)
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        init_migrations(app)
+    app.register_blueprint(api)
+    for rule, view, options in views:
+        app.add_url_rule(rule, view.__name__, view, **options)
+    app.register_error_handler(404, not_found_error)
+    app.register_error_handler(500, server_error)
+
+    if not app.debug:
+        file_handler = FileHandler('error.log')
+        file_handler.setFormatter(
+            Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+        )
+        app.logger.setLevel(logging.INFO)
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
+        app.logger.info('errors')
+
+    # The schema is owned by the Alembic history in migrations/: run
+    # `flask db upgrade` (or `flask fyyur init-db` for a scratch database)
+    # before the first start.
+    with app.app_context():
+        check_pool(app)
+    return app
+
+
+def init_migrations(app):
+    # Only the flask CLI (`flask db ...`) needs Flask-Migrate, and importing
+    # it loads all of Alembic, so web workers skip it.
+    from flask_migrate import Migrate
+    Migrate(app, db, directory=os.path.join(app.root_path, 'migrations'))
+
+
+def check_pool(app):
+    # Reports the pool the engine was actually built with, and warns when the
+    # workers together could open more connections than the server allows.
+    engine = db.get_engine(app)
+    pool = engine.pool
+    size = pool.size() if hasattr(pool, 'size') else None
+    overflow = getattr(pool, '_max_overflow', 0)
+    app.logger.info('database pool: %s size=%s max_overflow=%s url=%r',
+                    type(pool).__name__, size, overflow, engine.url)
+    if size is not None:
+        workers = app.config.get('WEB_CONCURRENCY', 1)
+        budget = workers * (size + max(overflow, 0))
+        if budget > app.config.get('DB_MAX_CONNECTIONS', 100):
+            app.logger.warning('%d workers may open %d connections, more than DB_MAX_CONNECTIONS=%d',
+                               workers, budget, app.config['DB_MAX_CONNECTIONS'])
 
 
-# track modifications should be set to false
 # ----------------------------------------------------------------------------#
 # Models.
 # ----------------------------------------------------------------------------#
@@ -45,23 +150,168 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 # Filters.
 # ----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
+def preformat_shows(data):
+    # Copies a cached detail payload with its show times formatted for this
+    # request's locale and timezone.
+    return dict(
+        data,
+        past_shows=list(formatter.preformat(data['past_shows'], 'start_time', 'full')),
+        upcoming_shows=list(formatter.preformat(data['upcoming_shows'], 'start_time', 'full')),
+    )
+
 
+# Detail page rendering, shared with the async entry point (asgi.py).
 
-app.jinja_env.filters['datetime'] = format_datetime
+def render_venue(data):
+    return render_template('pages/show_venue.html', venue=preformat_shows(data))
+
+
+def render_artist(data):
+    return render_template('pages/show_artist.html', artist=preformat_shows(data))
+
+
+# ----------------------------------------------------------------------------#
+# Listings.
+# ----------------------------------------------------------------------------#
+
+def stream_template(template_name, **context):
+    current_app.update_template_context(context)
+    template = current_app.jinja_env.get_template(template_name)
+    return Response(stream_with_context(template.generate(context)))
+
+
+def render_listing(template_name, name, page, shape=iter, **context):
+    # ?after=<cursor> continues a keyset-paginated listing and ?limit= sets the
+    # page size. ?stream=1 renders every row from the cursor on as a streamed
+    # response, fetching one page at a time while the template is generated.
+    # context goes to the template as is.
+    after = request.args.get('after')
+    limit = min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE)
+    if limit < 1:
+        abort(400)
+    try:
+        if after:
+            decode_cursor(after)
+        if request.args.get('stream'):
+            return stream_template(template_name, **{name: shape(iter_keyset(page, after, limit))}, **context)
+        rows, next_cursor = page(after=after, limit=limit)
+    except ValueError:
+        abort(400)
+    return render_template(template_name, next_cursor=next_cursor, **{name: shape(rows)}, **context)
+
+
+def render_genre_listing(template_name, name, page, genre_index, shape=iter):
+    # ?genre= (repeatable) keeps the rows having every genre given; the
+    # template also gets the genre facet counts for the current selection,
+    # on the first page only.
+    genres = normalize_genres(request.args.getlist('genre'))
+    facets = [] if request.args.get('after') else genre_index.facets(genres)
+    return render_listing(template_name, name, partial(page, genres=genres), shape,
+                          genres=genres, facets=facets)
+
+
+# ----------------------------------------------------------------------------#
+# Cache.
+# ----------------------------------------------------------------------------#
+# Venue and artist detail payloads are cached under venue:<id> / artist:<id>.
+# A venue page lists its artists and an artist page its venues, so a write
+# to one also drops the cached pages of everything it shares a show with.
+
+def detail_ttl(payload):
+    # A cached page also expires when its next upcoming show starts, since
+    # that show then moves from upcoming to past.
+    ttl = current_app.config.get('CACHE_TTL', 300)
+    if payload['upcoming_shows']:
+        next_start = min(show['start_time'] for show in payload['upcoming_shows'])
+        ttl = min(ttl, max((next_start - datetime.now()).total_seconds(), 1))
+    return ttl
+
+
+def venue_cache_keys(venue_id):
+    artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()
+    return [f'venue:{venue_id}'] + [f'artist:{artist_id}' for artist_id, in artist_ids]
+
+
+def artist_cache_keys(artist_id):
+    venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+    return [f'artist:{artist_id}'] + [f'venue:{venue_id}' for venue_id, in venue_ids]
+
+
+#  Hooks
+#  ----------------------------------------------------------------
+# Writes emit events once committed (see jobs.py): venue.created,
+# venue.updated, venue.deleted (venue_id), artist.created, artist.updated
+# (artist_id) and shows.created (venue_ids, artist_ids). The handlers below
+# warm the detail pages a write just dropped from the cache; they are only
+# subscribed when the cache is shared (redis). They run outside any request,
+# so their reads go to the primary.
+
+def table_versions():
+    return dict(db.session.query(TableVersion.name, TableVersion.version))
+
+
+def warm_detail(key, load, entity_id):
+    # A write commits before it deletes the keys it changes. So the page is
+    # set first and the table versions compared afterwards: if a write
+    # committed while the page loaded, its delete may have come before the
+    # set, and the page is dropped again; a write committing later deletes
+    # it itself.
+    versions = table_versions()
+    now = datetime.now()
+    data = load(entity_id, now, history_since(now, current_app.config.get('SHOW_HISTORY_MONTHS', 12)))
+    if data is None:
+        return
+    cache.set(key, data, ttl=detail_ttl)
+    # Ends the read transaction, so the check sees commits made since.
+    db.session.rollback()
+    if table_versions() != versions:
+        cache.delete(key)
+
+
+@warms('venue.created', 'venue.updated')
+def warm_venue(venue_id):
+    warm_detail(f'venue:{venue_id}', venue_detail, venue_id)
+
+
+@warms('artist.created', 'artist.updated')
+def warm_artist(artist_id):
+    warm_detail(f'artist:{artist_id}', artist_detail, artist_id)
+
+
+@warms('shows.created')
+def warm_show_pages(venue_ids, artist_ids):
+    for venue_id in venue_ids:
+        warm_detail(f'venue:{venue_id}', venue_detail, venue_id)
+    for artist_id in artist_ids:
+        warm_detail(f'artist:{artist_id}', artist_detail, artist_id)
+
+
+@route('/__debug__/cache')
+def cache_stats():
+    if not current_app.debug:
+        abort(404)
+    return jsonify(pages=cache.stats(), fragments=fragments.stats())
+
+
+@route('/__debug__/jobs')
+def job_stats():
+    if not current_app.debug:
+        abort(404)
+    return jsonify(jobs.stats())
+
+
+@route('/__debug__/replicas')
+def replica_status():
+    if not current_app.debug:
+        abort(404)
+    return jsonify(replicas.status())
 
 
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
 
-@app.route('/')
+@route('/')
 def index():
     return render_template('pages/home.html')
 
@@ -69,132 +319,63 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@route('/venues')
 def venues():
     # DONE: replace with real venues data.
     #       num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-    error = False
-    try:
-        venues = Venue.query.with_entities(Venue.city, Venue.state, Venue.id).distinct()
-        data = []
-        for venue in venues:
-            city = venue.city
-            state = venue.state
-            specific_venues = Venue.query.filter((Venue.city == city) & (Venue.state == state)).all()
-            temp_data = []
-            for item in specific_venues:
-                temp_data.append({
-                    "id": item.id,
-                    "name": item.name,
-                    "num_upcoming_shows": 1
-                })
-            data.append({"city": city, "state": state, "venues": temp_data})
-    
-    except:
-        db.session.rollback
-        error = True
-    finally:
-        db.session.close
-    if error:
-        flash('An error occurred.')
-    else:
-        pass
-    return render_template('index.html', result=data)
+    return render_genre_listing('pages/venues.html', 'areas', venue_page, venue_genres, group_areas)
 
 
-@app.route('/venues/search', methods=['POST'])
+@route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
     # DONE: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
     search_term = request.form.get('search_term', '')
-    # use db.session here?
-    values_returned = Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()
-    count = len(values_returned)
-    data = []
-    for item in values_returned:
-        data.append({
-            "id": item.id,
-            "name": item.name,
-            "num_upcoming_shows": len(
-                Show.query.filter(Show.venue_id == item.id).filter(Show.start_time > datetime.now()).all())
-        })
-        response = {"count": count, "data": data}
-    # response={
-    #   "count": 1,
-    #   "data": [{
-    #     "id": 2,
-    #     "name": "The Dueling Pianos Bar",
-    #     "num_upcoming_shows": 0,
-    #   }]
-    # }
+    data = venue_search(search_term, limit=request.form.get('limit', type=int),
+                        prefix=bool(request.form.get('prefix')))
+    response = {"count": len(data), "data": data}
     return render_template('pages/search_venues.html', results=response,
                            search_term=request.form.get('search_term', ''))
 
 
-@app.route('/venues/<int:venue_id>')
+@route('/venues/<int:venue_id>')
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
     # DONE: replace with real venue data from the venues table, using venue_id
     error = False
     try:
-        specific_venue = Venue.query.get(venue_id)
-        particular_shows = Show.query.filter(Show.venue_id == venue_id).order_by(Show.artist_id)
-        past_shows = []
-        upcoming_shows = []
-        for show in particular_shows:
-            artist_id = show.artist_id
-            data_artist = {
-                "artist_id": artist_id,
-                "artist_name": Artist.query.get(artist_id).name,
-                "artist_image_link": Artist.query.get(artist_id).image_link,
-                "start_time": show.start_time
-            }
-            if show.start_time < datetime.now():
-                past_shows.append(data_artist)
-            elif show.start_time > datetime.now():
-                upcoming_shows.append(data_artist)
-        data = {
-            "id": specific_venue.id,
-            "name": specific_venue.name,
-            "genres": specific_venue.genres,
-            "address": specific_venue.address,
-            "city": specific_venue.city,
-            "state": specific_venue.state,
-            "phone": specific_venue.phone,
-            "website": specific_venue.website,
-            "facebook_link": specific_venue.facebook_link,
-            "seeking_talent": specific_venue.seeking_talent,
-            "seeking_description": specific_venue.seeking_description,
-            "image_link": specific_venue.image_link,
-            "past_shows": past_shows,
-            "upcoming_shows": upcoming_shows,
-            "past_shows_count": len(past_shows),
-            "upcoming_shows_count": len(upcoming_shows),
-        }
-
+        now = datetime.now()
+        since = history_window(now)
+        if since is None:
+            # ?history=all is rare enough to skip the cache.
+            data = venue_detail(venue_id, now)
+        else:
+            data = cache.get_or_set(f'venue:{venue_id}', lambda: venue_detail(venue_id, now, since),
+                                    ttl=detail_ttl)
     except:
         db.session.rollback()
         error = True
     finally:
         db.session.close()
     if error:
-        pass
-    else:
-        pass
-    return render_template('pages/show_venue.html', venue=data)
+        abort(500)
+    if data is None:
+        abort(404)
+    return render_venue(data)
 
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@route('/venues/create', methods=['GET'])
 def create_venue_form():
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@route('/venues/create', methods=['POST'])
 def create_venue_submission():
     # DONE: insert form data as a new Venue record in the db, instead
     # DONE: modify data to be the data object returned from db insertion
@@ -206,7 +387,7 @@ def create_venue_submission():
         address = request.form.get("address")
         phone = request.form.get("phone")
         image_link = request.form.get("image_link")
-        genres = ",".join(request.form.get('genres'))
+        genres = normalize_genres(request.form.getlist('genres'))
         facebook_link = request.form.get("facebook_link")
         website_link = request.form.get("website_link")
         if request.form.get('seeking_talent'):
@@ -223,6 +404,7 @@ def create_venue_submission():
 
         db.session.add(created_venue)
         db.session.commit()
+        venue_id = created_venue.id
 
     except:
         db.session.rollback()
@@ -235,125 +417,97 @@ def create_venue_submission():
         flash('An error occurred. Venue ' + request.form['name'] + ' could not be listed.')
     else:
         flash('Venue ' + request.form['name'] + ' was successfully listed!')
+        jobs.emit('venue.created', venue_id=venue_id)
     return render_template('pages/home.html')
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
     # DONE: Complete this endpoint for taking a venue_id, and using
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
+    venue = Venue.query.get(venue_id)
+    if venue is None:
+        abort(404)
+    # Read before the delete expires the row.
+    name = venue.name
     error = False
     try:
-        venue = Venue.query.get(venue_id)
+        stale_keys = venue_cache_keys(venue_id)
         db.session.delete(venue)
         db.session.commit()
+        cache.delete(*stale_keys)
     except:
         db.session.rollback()
         error = True
     finally:
         db.session.close()
     if error:
-        flash(f'An error occurred. Venue {(Venue.query.get(venue_id)).name} could not be deleted.')
+        flash(f'An error occurred. Venue {name} could not be deleted.')
     else:
-        flash(f'Venue {(Venue.query.get(venue_id)).name} was successfully deleted!')
-    return None
+        flash(f'Venue {name} was successfully deleted!')
+        jobs.emit('venue.deleted', venue_id=venue_id)
+    return jsonify(success=not error)
 
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@route('/artists')
 def artists():
     # DONE: replace with real data returned from querying the database
-    data = Artist.query.all()
-    # data=[]
-    # for artist in all_artists:
-    #   data.append({"id":artist.id, "name":artist.name})
-    return render_template('pages/artists.html', artists=data)
+    return render_genre_listing('pages/artists.html', 'artists', artist_page, artist_genres)
 
 
-@app.route('/artists/search', methods=['POST'])
+@route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
     # DONE: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
     search_term = request.form.get('search_term', '')
-    values_returned = Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).all()
-    count = len(values_returned)
-    data = []
-    for item in values_returned:
-        data.append({
-            "id": item.id,
-            "name": item.name,
-            "num_upcoming_shows": len(
-                Show.query.filter(Show.artist_id == item.id).filter(Show.start_time > datetime.now()).all())
-        })
-    response = {"count": count, "data": data}
+    data = artist_search(search_term, limit=request.form.get('limit', type=int),
+                         prefix=bool(request.form.get('prefix')))
+    response = {"count": len(data), "data": data}
 
     return render_template('pages/search_artists.html', results=response,
                            search_term=request.form.get('search_term', ''))
 
 
-@app.route('/artists/<int:artist_id>')
+@route('/artists/<int:artist_id>')
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
     # DONE: replace with real artist data from the artist table, using artist_id
     error = False
     try:
-        specific_artist = Artist.query.get(artist_id)
-        particular_shows = Show.query.filter(Show.artist_id == artist_id).order_by(Show.artist_id)
-        past_shows = []
-        upcoming_shows = []
-        for show in particular_shows:
-            venue_id = show.venue_id
-            data_venue = {
-                "venue_id": venue_id,
-                "venue_name": Venue.query.get(venue_id).name,
-                "venue_image_link": Venue.query.get(venue_id).image_link,
-                "start_time": show.start_time
-            }
-            if show.start_time < datetime.now():
-                past_shows.append(data_venue)
-            elif show.start_time > datetime.now():
-                upcoming_shows.append(data_venue)
-        data = {
-            "id": specific_artist.id,
-            "name": specific_artist.name,
-            "genres": specific_artist.genres,
-            "city": specific_artist.city,
-            "state": specific_artist.state,
-            "phone": specific_artist.phone,
-            "website": specific_artist.website,
-            "facebook_link": specific_artist.facebook_link,
-            "seeking_venue": specific_artist.seeking_venue,
-            "seeking_description": specific_artist.seeking_description,
-            "image_link": specific_artist.image_link,
-            "past_shows": past_shows,
-            "upcoming_shows": upcoming_shows,
-            "past_shows_count": len(past_shows),
-            "upcoming_shows_count": len(upcoming_shows),
-        }
+        now = datetime.now()
+        since = history_window(now)
+        if since is None:
+            # ?history=all is rare enough to skip the cache.
+            data = artist_detail(artist_id, now)
+        else:
+            data = cache.get_or_set(f'artist:{artist_id}', lambda: artist_detail(artist_id, now, since),
+                                    ttl=detail_ttl)
     except:
         db.session.rollback()
         error = True
     finally:
         db.session.close()
     if error:
-        flash('An error occurred.')
-    else:
-        pass
-    return render_template('pages/show_artist.html', artist=data)
+        abort(500)
+    if data is None:
+        abort(404)
+    return render_artist(data)
 
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
     form = ArtistForm()
     artist = Artist.query.get(artist_id)
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
     error = False
     try:
@@ -363,7 +517,7 @@ def edit_artist_submission(artist_id):
         artist.state = request.form['state']
         artist.phone = request.form['phone']
         artist.image_link = request.form['image_link']
-        artist.genres = ",".join(request.form.get('genres'))
+        artist.genres = normalize_genres(request.form.getlist('genres'))
         artist.facebook_link = request.form['facebook_link']
         artist.website_link = request.form['website_link']
         if 'seeking_venue' in request.form['seeking_venue']:
@@ -373,6 +527,7 @@ def edit_artist_submission(artist_id):
         artist.seeking_description = request.form['seeking_description']
         db.session.add(artist)
         db.session.commit()
+        cache.delete(*artist_cache_keys(artist_id))
     except:
         db.session.rollback()
         error = True
@@ -382,17 +537,18 @@ def edit_artist_submission(artist_id):
         flash('An error occurred. Artist ' + request.form['name'] + ' could not be updated.')
     else:
         flash('Artist ' + request.form['name'] + ' was successfully updated!')
+        jobs.emit('artist.updated', artist_id=artist_id)
     return redirect(url_for('show_artist', artist_id=artist_id))
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
     form = VenueForm()
     venue = Venue.query.get(venue_id)
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
     error = False
     try:
@@ -403,13 +559,14 @@ def edit_venue_submission(venue_id):
         venue.address = request.form['address']
         venue.phone = request.form['phone']
         venue.image_link = request.form['image_link']
-        venue.genres = ",".join(request.form.get('genres'))
+        venue.genres = normalize_genres(request.form.getlist('genres'))
         venue.facebook_link = request.form['facebook_link']
         venue.website_link = request.form['website_link']
         venue.seeking_talent = request.form['seeking_talent']
         venue.seeking_description = request.form['seeking_description']
         db.session.add(venue)
         db.session.commit()
+        cache.delete(*venue_cache_keys(venue_id))
     except:
         db.session.rollback()
         error = True
@@ -420,19 +577,20 @@ def edit_venue_submission(venue_id):
         flash('An error occurred. Venue ' + request.form['name'] + ' could not be updated.')
     else:
         flash('Venue ' + request.form['name'] + ' was successfully updated!')
+        jobs.emit('venue.updated', venue_id=venue_id)
     return redirect(url_for('show_venue', venue_id=venue_id))
 
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@route('/artists/create', methods=['GET'])
 def create_artist_form():
     form = ArtistForm()
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@route('/artists/create', methods=['POST'])
 def create_artist_submission():
     error = False
     try:
@@ -441,7 +599,7 @@ def create_artist_submission():
         state = request.form['state']
         phone = request.form['phone']
         image_link = request.form['image_link']
-        genres = ",".join(request.form.get('genres'))
+        genres = normalize_genres(request.form.getlist('genres'))
         facebook_link = request.form['facebook_link']
         website_link = request.form['website_link']
         if request.form.get('seeking_venue'):
@@ -453,6 +611,7 @@ def create_artist_submission():
                                 seeking_description=seeking_description)
         db.session.add(created_artist)
         db.session.commit()
+        artist_id = created_artist.id
     except:
         db.session.rollback()
         error = True
@@ -463,101 +622,57 @@ def create_artist_submission():
         flash('An error occurred. Artist ' + request.form['name'] + ' could not be listed.')
     else:
         flash('Artist ' + request.form['name'] + ' was successfully listed!')
+        jobs.emit('artist.created', artist_id=artist_id)
     return render_template('pages/home.html')
 
 
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@route('/shows')
 def shows():
-    data = []
-    show_all = Show.query.all()
-    for show in show_all:
-        artist_id = show.artist_id
-        venue_id = show.venue_id
-        data.append({
-            "venue_id": venue_id,
-            "venue_name": Venue.query.get(venue_id).name,
-            "artist_id": artist_id,
-            "artist_name": Artist.query.get(artist_id).name,
-            "artist_image_link": Artist.query.get(artist_id).image_link,
-            "start_time": show.start_time
-        })
-
-    return render_template('pages/shows.html', shows=data)
-
-
-@app.route('/shows/create')
+    return render_listing('pages/shows.html', 'shows', show_page,
+                          lambda rows: formatter.preformat(rows, 'start_time', 'full'))
+
+
+@route('/shows/create')
 def create_shows():
     # renders form. do not touch.
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@route('/shows/create', methods=['POST'])
 def create_show_submission():
-    error_venue = False
-    error_artist = False
-    try:
-        venue_id = request.form['venue_id']
-        artist_id = request.form['artist_id']
-        start_time = request.form['start_time']
-        possible_venue = Venue.query.get(venue_id)
-        possible_artist = Artist.query.get(artist_id)
-        # Adding records to show
-        created_show = Show(venue_id=possible_venue.id, artist_id=possible_artist.id, start_time=start_time)
-        db.session.add(created_show)
-        db.session.commit()
-    except:
-        db.session.rollback()
-        if possible_venue is None:
-            error_venue = True
-        if possible_artist is None:
-            error_artist = True
-    finally:
-        db.session.close()
-    if error_venue == True:
-        flash('An error occurred. Show could not be listed. Make sure venue_id is correct.')
-
-    if error_artist == True:
-        flash('An error occurred. Show could not be listed. Make sure artist_id is correct.')
-    if error_venue == False and error_artist == False:
+    created, errors = book_shows([request.form])
+    for error in errors:
+        for messages in error['errors'].values():
+            for message in messages:
+                flash(f'An error occurred. Show could not be listed. {message}')
+    if created:
         flash('Show was successfully listed!')
     return render_template('pages/home.html')
 
 
-@app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
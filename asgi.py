@@ -0,0 +1,182 @@
+# ----------------------------------------------------------------------------#
+# Optional ASGI entry point:  uvicorn asgi:application
+# ----------------------------------------------------------------------------#
+# Venue and artist detail pages are served asynchronously. Their statements
+# (the same ones queries.py builds for the sync views) run on an async
+# engine over asyncpg, so one worker keeps any number of them in flight
+# while Postgres works, and only blocking work (the page cache and template
+# rendering) goes to a small thread pool. Rendering runs inside a Flask
+# request context with app.py's render functions, error handlers and
+# before/after_request hooks. Every other route is the unchanged Flask app
+# behind asgiref's WsgiToAsgi, so both modes serve the same URL map; so are
+# full-history (?history=all) detail pages, which are rare and uncached.
+#
+# Needs SQLAlchemy>=1.4, asyncpg and asgiref; app.py runs without them.
+#
+# Config:
+#   ASYNC_DATABASE_URL    async engine URL (default: the primary database,
+#                         with the postgresql+asyncpg driver)
+#   ASGI_RENDER_THREADS   threads for rendering and cache access
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+except ImportError:
+    raise RuntimeError('asgi.py needs SQLAlchemy>=1.4, asyncpg and asgiref')
+
+from flask import abort
+from werkzeug.exceptions import HTTPException
+from werkzeug.urls import url_decode
+
+from app import create_app, detail_ttl, render_artist, render_venue
+from cache import cache
+from partitions import history_since
+from queries import artist_detail_statements, artist_payload, venue_detail_statements, venue_payload
+
+# endpoint: (URL argument, cache key prefix, statements, payload, render)
+ASYNC_VIEWS = {
+    'show_venue': ('venue_id', 'venue', venue_detail_statements, venue_payload, render_venue),
+    'show_artist': ('artist_id', 'artist', artist_detail_statements, artist_payload, render_artist),
+}
+
+
+def wsgi_environ(scope):
+    # The WSGI environ for a bodiless ASGI http request.
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('',))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin1')
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    return environ
+
+
+def async_url(uri):
+    scheme, rest = uri.split('://', 1)
+    if scheme not in ('postgresql', 'postgres', 'postgresql+psycopg2'):
+        raise RuntimeError(f'the async entry point needs Postgres, not {scheme}')
+    return 'postgresql+asyncpg://' + rest
+
+
+def async_engine_options(options):
+    # SQLALCHEMY_ENGINE_OPTIONS (see config.engine_options), with the libpq
+    # statement timeout turned into an asyncpg server setting.
+    options = dict(options)
+    connect_args = options.pop('connect_args', {})
+    if 'statement_timeout=' in connect_args.get('options', ''):
+        timeout = connect_args['options'].split('statement_timeout=', 1)[1].split()[0]
+        options['connect_args'] = {'server_settings': {'statement_timeout': timeout}}
+    return options
+
+
+class AsyncApplication:
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        url = flask_app.config.get('ASYNC_DATABASE_URL') or \
+            async_url(flask_app.config['SQLALCHEMY_DATABASE_URI'])
+        self.engine = create_async_engine(
+            url, **async_engine_options(flask_app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})))
+        self.pool = ThreadPoolExecutor(flask_app.config.get('ASGI_RENDER_THREADS', 4),
+                                       thread_name_prefix='fyyur-render')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            environ = wsgi_environ(scope)
+            try:
+                endpoint, args = self.app.url_map.bind_to_environ(environ).match()
+            except HTTPException:
+                endpoint = None
+            if endpoint in ASYNC_VIEWS and url_decode(environ['QUERY_STRING']).get('history') != 'all':
+                return await self.serve(ASYNC_VIEWS[endpoint], args, environ, send)
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                self.pool.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def serve(self, view, args, environ, send):
+        arg, prefix, statements, payload, render = view
+        loop = asyncio.get_running_loop()
+        key = f'{prefix}:{args[arg]}'
+        data = await loop.run_in_executor(self.pool, cache.get, key)
+        if data is None:
+            data = await self.load(statements, payload, args[arg])
+            if data is not None:
+                await loop.run_in_executor(self.pool, self.store, key, data)
+        response = await loop.run_in_executor(self.pool, self.render, render, data, environ)
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1'))
+                        for name, value in response.get_wsgi_headers(environ).to_wsgi_list()],
+        })
+        body = b'' if environ['REQUEST_METHOD'] == 'HEAD' else response.get_data()
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def load(self, statements, payload, entity_id):
+        now = datetime.now()
+        since = history_since(now, self.app.config.get('SHOW_HISTORY_MONTHS', 12))
+        entity, shows = statements(entity_id, now, since)
+        async with AsyncSession(self.engine) as session:
+            row = (await session.execute(entity)).first()
+            if row is None:
+                return None
+            return payload(row, (await session.execute(shows)).all(), since)
+
+    def store(self, key, data):
+        # detail_ttl reads the app's config.
+        with self.app.app_context():
+            cache.set(key, data, detail_ttl)
+
+    def render(self, render, data, environ):
+        # Runs on the thread pool; mirrors Flask's full_dispatch_request with
+        # the data already loaded.
+        with self.app.request_context(environ):
+            try:
+                rv = self.app.preprocess_request()
+                if rv is None:
+                    if data is None:
+                        abort(404)
+                    rv = render(data)
+            except HTTPException as error:
+                rv = self.app.handle_user_exception(error)
+            except Exception as error:
+                rv = self.app.handle_exception(error)
+            return self.app.process_response(self.app.make_response(rv))
+
+
+application = AsyncApplication(create_app())
@@ -0,0 +1,216 @@
+# ----------------------------------------------------------------------------#
+# Static assets.
+# ----------------------------------------------------------------------------#
+# `flask fyyur build-assets` concatenates and minifies the BUNDLES, copies
+# every file under static/ to static/dist/ with a content hash in its name,
+# writes pre-compressed .gz (and, with the brotli package, .br) variants and
+# records logical name -> built file in static/dist/manifest.json. Relative
+# url()s in the CSS are rewritten to the built files.
+#
+# When a manifest is present, url_for('static', filename=...) and
+# bundle_urls() resolve through it, and built files are served in the best
+# encoding the client accepts with a one-year immutable Cache-Control: a
+# changed file gets a new name, so nothing ever needs revalidating. Without
+# one (development), bundles link their source files one by one.
+#
+# rcssmin and rjsmin do the minifying when installed; without them CSS loses
+# its comments and whitespace and JS is only concatenated.
+#
+# Config:
+#   ASSETS_DIR      build output, relative to the static folder
+#   ASSETS_MAX_AGE  max-age of built files, in seconds
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+# Bundle name: source files, in load order.
+BUNDLES = {
+    'css/site.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css',
+                     'css/main.responsive.css', 'css/main.quickfix.css'],
+    'js/head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js', 'js/script.js'],
+    'js/site.js': ['js/libs/jquery-1.11.1.min.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+}
+
+# Extensions worth pre-compressing; images and woff are compressed already.
+COMPRESSIBLE = {'.css', '.js', '.map', '.json', '.svg', '.ico', '.eot', '.otf', '.ttf'}
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+HASH_LENGTH = 10
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+CSS_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.S)
+SOURCE_MAP = re.compile(r'^\s*//[#@] sourceMappingURL=.*$', re.M)
+
+
+#  Build
+#  ----------------------------------------------------------------
+
+def minify_css(text):
+    if rcssmin is not None:
+        return rcssmin.cssmin(text, keep_bang_comments=True)
+    text = re.sub(r'\s+', ' ', CSS_COMMENT.sub('', text))
+    return re.sub(r'\s*([{};,>])\s*', r'\1', text).strip()
+
+
+def minify_js(text):
+    # Source map comments would point at the unbundled files.
+    text = SOURCE_MAP.sub('', text)
+    if rjsmin is not None:
+        return rjsmin.jsmin(text, keep_bang_comments=True)
+    return text.strip()
+
+
+def rebase_css(text, path, manifest, url_path):
+    # Points the relative url()s of static/<path> at absolute URLs, of the
+    # built files where there are any.
+    base = posixpath.dirname(path)
+
+    def rewrite(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        target, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        target = posixpath.normpath(posixpath.join(base, target))
+        return f'url({quote}{url_path}/{manifest.get(target, target)}{suffix}{quote})'
+    return CSS_URL.sub(rewrite, text)
+
+
+def write_asset(static_folder, output, path, data):
+    # Writes data under its fingerprinted name, with compressed variants
+    # where they are smaller; returns the name relative to static/.
+    root, ext = posixpath.splitext(path)
+    built = f'{output}/{root}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}'
+    target = os.path.join(static_folder, *built.split('/'))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    variants = {'': data}
+    if ext in COMPRESSIBLE:
+        variants['.gz'] = gzip.compress(data, 9, mtime=0)
+        if brotli is not None:
+            variants['.br'] = brotli.compress(data, quality=11)
+    for suffix, content in variants.items():
+        if not suffix or len(content) < len(data):
+            with open(target + suffix, 'wb') as f:
+                f.write(content)
+    return built
+
+
+def static_files(static_folder, output):
+    for directory, dirnames, filenames in os.walk(static_folder):
+        relative = os.path.relpath(directory, static_folder).replace(os.sep, '/')
+        if relative == output:
+            dirnames[:] = []
+            continue
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+        for name in sorted(filenames):
+            if not name.startswith('.'):
+                yield name if relative == '.' else f'{relative}/{name}'
+
+
+def build(static_folder, url_path='/static', output='dist'):
+    # Rebuilds static/<output> from scratch; returns the manifest.
+    target = os.path.join(static_folder, output)
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+
+    def read(path):
+        with open(os.path.join(static_folder, *path.split('/')), 'rb') as f:
+            return f.read()
+
+    # Everything but CSS first, so the CSS can point at the built names.
+    paths = sorted(static_files(static_folder, output), key=lambda path: path.endswith('.css'))
+    manifest = {}
+    for path in paths:
+        data = read(path)
+        if path.endswith('.css'):
+            data = rebase_css(data.decode('utf-8'), path, manifest, url_path).encode('utf-8')
+        manifest[path] = write_asset(static_folder, output, path, data)
+    for name, sources in BUNDLES.items():
+        if name.endswith('.css'):
+            text = minify_css('\n'.join(rebase_css(read(source).decode('utf-8'), source, manifest, url_path)
+                                        for source in sources))
+        else:
+            # Guards against sources that end without a semicolon.
+            text = ';\n'.join(minify_js(read(source).decode('utf-8')) for source in sources)
+        manifest[name] = write_asset(static_folder, output, name, text.encode('utf-8'))
+    with open(os.path.join(target, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+    return manifest
+
+
+#  Serving
+#  ----------------------------------------------------------------
+
+class Assets:
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.encodings = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.max_age = app.config.get('ASSETS_MAX_AGE', 365 * 24 * 3600)
+        self.load(os.path.join(app.static_folder, app.config.get('ASSETS_DIR', 'dist'), 'manifest.json'))
+        app.extensions['assets'] = self
+        app.url_defaults(self._url_defaults)
+        app.add_template_global(self.bundle_urls)
+        app.view_functions['static'] = self.send_static
+
+    def load(self, path):
+        try:
+            with open(path) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+        # built file: [(encoding, suffix)] of the variants written for it
+        self.encodings = {
+            built: [(encoding, suffix) for encoding, suffix in ENCODINGS
+                    if os.path.isfile(os.path.join(self.static_folder, built + suffix))]
+            for built in self.manifest.values()
+        }
+
+    def _url_defaults(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.manifest:
+            values['filename'] = self.manifest[values['filename']]
+
+    def bundle_urls(self, name):
+        # Template global: the URLs to load bundle `name` from.
+        if name in self.manifest:
+            return [url_for('static', filename=name)]
+        return [url_for('static', filename=source) for source in BUNDLES[name]]
+
+    def send_static(self, filename):
+        if filename not in self.encodings:
+            return current_app.send_static_file(filename)
+        encoding, suffix = next(((encoding, suffix) for encoding, suffix in self.encodings[filename]
+                                 if encoding in request.accept_encodings), (None, ''))
+        response = send_from_directory(self.static_folder, filename + suffix,
+                                       mimetype=mimetypes.guess_type(filename)[0],
+                                       cache_timeout=self.max_age)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if self.encodings[filename]:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = f'public, max-age={self.max_age}, immutable'
+        return response
@@ -0,0 +1,187 @@
+# ----------------------------------------------------------------------------#
+# Availability.
+# ----------------------------------------------------------------------------#
+# BookingIndex answers "when are these venues or artists booked, and when are
+# they free" from memory. Per venue and per artist it keeps the sorted start
+# times of their shows from the month before it was built on. A show holds
+# its venue and artist for SHOW_DURATION minutes (as in bookings.py), so the
+# shows overlapping a time range are found by bisecting those lists.
+#
+# Each worker builds its index before its first request, then follows the
+# database through the ix_Show_updated_at index: reads catch up on the shows
+# written since the last sync at most every AVAILABILITY_SYNC_INTERVAL
+# seconds, and book_shows() syncs right after committing, so a worker's own
+# bookings show up at once. A delete leaves no updated_at behind. One made
+# through this worker's ORM rebuilds the index; one made elsewhere shows as
+# booked until the next rebuild, every AVAILABILITY_REBUILD_INTERVAL seconds
+# (book_shows() checks the database either way). Ranges reaching back before
+# the index's first month are read from the database.
+#
+# Config:
+#   AVAILABILITY_SYNC_INTERVAL     seconds between catch-up reads
+#   AVAILABILITY_REBUILD_INTERVAL  seconds between full rebuilds
+#   SHOW_DURATION                  minutes a show holds its venue and artist
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from models import db, Show
+from partitions import add_months, month_start
+
+# Catch-up reads go back this far past the newest updated_at seen, for
+# transactions that committed after a later one.
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class BookingIndex:
+
+    def __init__(self, app=None):
+        self.duration = timedelta(minutes=180)
+        self.sync_interval = 1
+        self.rebuild_interval = 600
+        self._lock = threading.Lock()
+        self._reset()
+        db.event.listen(Show, 'after_delete', self._deleted)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.duration = timedelta(minutes=app.config.get('SHOW_DURATION', 180))
+        self.sync_interval = app.config.get('AVAILABILITY_SYNC_INTERVAL', 1)
+        self.rebuild_interval = app.config.get('AVAILABILITY_REBUILD_INTERVAL', 600)
+        app.extensions['booking_index'] = self
+        app.before_first_request(self.build)
+
+    def _reset(self):
+        self.shows = {}
+        # 'venue' / 'artist': {id: sorted start times}
+        self.starts = {'venue': defaultdict(list), 'artist': defaultdict(list)}
+        self.horizon = None
+        self.synced_to = None
+        self._built_at = self._synced_at = 0.0
+        self._stale = True
+
+    #  Upkeep
+    #  ----------------------------------------------------------------
+
+    def build(self):
+        horizon = add_months(month_start(datetime.now()), -1)
+        # Read first: anything written during the load is synced again.
+        synced_to = db.session.query(db.func.max(Show.updated_at)).scalar()
+        rows = db.session.query(Show.id, Show.venue_id, Show.artist_id, Show.start_time) \
+            .filter(Show.start_time >= horizon)
+        shows = {id: (venue_id, artist_id, start) for id, venue_id, artist_id, start in rows}
+        starts = {'venue': defaultdict(list), 'artist': defaultdict(list)}
+        for venue_id, artist_id, start in shows.values():
+            starts['venue'][venue_id].append(start)
+            starts['artist'][artist_id].append(start)
+        for owners in starts.values():
+            for owner_starts in owners.values():
+                owner_starts.sort()
+        with self._lock:
+            self.shows, self.starts, self.horizon, self.synced_to = shows, starts, horizon, synced_to
+            self._built_at = self._synced_at = time.monotonic()
+            self._stale = False
+
+    def sync(self):
+        # Applies the shows inserted or updated since the last sync.
+        if self._stale:
+            return
+        query = db.session.query(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.updated_at)
+        if self.synced_to is not None:
+            query = query.filter(Show.updated_at > self.synced_to - SYNC_OVERLAP)
+        rows = query.all()
+        with self._lock:
+            for id, venue_id, artist_id, start, updated_at in rows:
+                show = (venue_id, artist_id, start)
+                if self.shows.get(id) != show:
+                    self._remove(id)
+                    if start >= self.horizon:
+                        self._add(id, show)
+                if self.synced_to is None or updated_at > self.synced_to:
+                    self.synced_to = updated_at
+            self._synced_at = time.monotonic()
+
+    def refresh(self):
+        # Brings the index up to date as far as the intervals ask.
+        elapsed = time.monotonic()
+        if self._stale or elapsed - self._built_at > self.rebuild_interval:
+            self.build()
+        elif elapsed - self._synced_at > self.sync_interval:
+            self.sync()
+
+    def invalidate(self):
+        # Rebuilt on the next read.
+        with self._lock:
+            self._stale = True
+
+    def _add(self, id, show):
+        venue_id, artist_id, start = show
+        self.shows[id] = show
+        insort(self.starts['venue'][venue_id], start)
+        insort(self.starts['artist'][artist_id], start)
+
+    def _remove(self, id):
+        show = self.shows.pop(id, None)
+        if show is None:
+            return
+        venue_id, artist_id, start = show
+        for owner_starts in (self.starts['venue'][venue_id], self.starts['artist'][artist_id]):
+            i = bisect_left(owner_starts, start)
+            if i < len(owner_starts) and owner_starts[i] == start:
+                del owner_starts[i]
+
+    def _deleted(self, mapper, connection, target):
+        self.invalidate()
+
+    #  Reads
+    #  ----------------------------------------------------------------
+
+    def booked(self, kind, ids, start, end):
+        # {id: sorted start times of the shows overlapping start..end} for
+        # kind 'venue' or 'artist'.
+        self.refresh()
+        earliest = start - self.duration
+        if earliest < self.horizon:
+            return self._booked_in_database(kind, ids, earliest, end)
+        with self._lock:
+            booked = {}
+            for id in ids:
+                owner_starts = self.starts[kind].get(id, [])
+                booked[id] = owner_starts[bisect_right(owner_starts, earliest):bisect_left(owner_starts, end)]
+            return booked
+
+    def _booked_in_database(self, kind, ids, earliest, end):
+        # A range read on the (venue_id, start_time) / (artist_id, start_time)
+        # index.
+        column = Show.venue_id if kind == 'venue' else Show.artist_id
+        booked = {id: [] for id in ids}
+        query = db.session.query(column, Show.start_time) \
+            .filter(column.in_(ids), Show.start_time > earliest, Show.start_time < end) \
+            .order_by(Show.start_time)
+        for id, show_start in query:
+            booked[id].append(show_start)
+        return booked
+
+    def availability(self, kind, ids, start, end):
+        # {id: {"booked": [...], "free": [...]}} with {"start", "end"}
+        # intervals. Booked intervals are whole shows, even where they run
+        # past the range; free ones are the gaps in the range long enough to
+        # hold a show.
+        result = {}
+        for id, starts in self.booked(kind, ids, start, end).items():
+            booked = [{"start": show_start, "end": show_start + self.duration} for show_start in starts]
+            free = []
+            cursor = start
+            for interval in booked + [{"start": end, "end": end}]:
+                gap_end = min(interval['start'], end)
+                if gap_end - cursor >= self.duration:
+                    free.append({"start": cursor, "end": gap_end})
+                cursor = max(cursor, interval['end'])
+            result[id] = {"booked": booked, "free": free}
+        return result
+
+
+booking_index = BookingIndex()
@@ -0,0 +1,4 @@
+# ----------------------------------------------------------------------------#
+# Benchmarks: seeded synthetic data, per-route microbenchmarks and a headless
+# load scenario. Run with `python -m benchmarks --help`.
+# ----------------------------------------------------------------------------#
@@ -0,0 +1,152 @@
+# ----------------------------------------------------------------------------#
+# python -m benchmarks
+# ----------------------------------------------------------------------------#
+# Seeds a database, benchmarks every route, runs the load scenario and checks
+# that no route's query count grows with the data. Results are printed as
+# JSON; --save writes them as the new baseline, and --compare exits non-zero
+# when a route got slower than the baseline by more than --tolerance (and
+# --min-delta ms) or issues more queries than it did. --explain also fails
+# when a route's query plan scans a table sequentially on the scaled data.
+# The cold start (`import app` plus create_app()) fails when it exceeds
+# --import-budget ms.
+#
+# Seeding drops every table first, so a --database other than a temporary
+# SQLite file is only used with --reset.
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('--database', help='Database URL (default: a temporary SQLite file).')
+    parser.add_argument('--reset', action='store_true',
+                        help='Allow dropping and reseeding a --database that is not a temporary file.')
+    parser.add_argument('--venues', type=int, default=200)
+    parser.add_argument('--artists', type=int, default=200)
+    parser.add_argument('--shows', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=10.0, help='Load scenario seconds.')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--scale', type=int, default=4,
+                        help='Data multiplier for the constant-query check (0 skips it).')
+    parser.add_argument('--explain', action='store_true',
+                        help='Fail on sequential scans in the scaled data set\'s query plans.')
+    parser.add_argument('--import-budget', type=float, default=600.0,
+                        help='Cold start budget in ms (0 skips the check).')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help='Write the results as the baseline.')
+    parser.add_argument('--compare', action='store_true', help='Fail on regressions against the baseline.')
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    parser.add_argument('--min-delta', type=float, default=1.0,
+                        help='Slowdowns smaller than this many ms are treated as noise.')
+    return parser.parse_args(argv)
+
+
+def regressions(results, baseline, tolerance, min_delta):
+    def slower(now, before):
+        return now > before * tolerance and now - before > min_delta
+
+    found = []
+    for name, current in results['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        if current['queries'] > before['queries']:
+            found.append(f"{name}: {current['queries']} queries, baseline {before['queries']}")
+        if slower(current['median_ms'], before['median_ms']):
+            found.append(f"{name}: median {current['median_ms']:.2f}ms, "
+                         f"baseline {before['median_ms']:.2f}ms")
+    load, before = results['load'], baseline.get('load')
+    if before and slower(load['p95_ms'], before['p95_ms']):
+        found.append(f"load: p95 {load['p95_ms']:.2f}ms, baseline {before['p95_ms']:.2f}ms")
+    return found
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    database = args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    # Measure the database path, not the page cache or the profiler.
+    os.environ['DATABASE_URL'] = database
+    os.environ.setdefault('CACHE_TYPE', 'null')
+    os.environ.setdefault('SQL_PROFILING', '0')
+    # Keeps the availability index's catch-up reads out of the query counts.
+    os.environ.setdefault('AVAILABILITY_SYNC_INTERVAL', '3600')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from wsgi import app
+    from benchmarks.data import is_scratch, seed_database
+    from benchmarks.explain import StatementRecorder, check_plans
+    from benchmarks.load import run_load
+    from benchmarks.routes import QueryCounter, count_queries, run_routes
+    from benchmarks.startup import measure_startup
+
+    if not args.reset and not is_scratch(database):
+        sys.exit('--database would be dropped and reseeded; pass --reset to use it anyway')
+    counter = QueryCounter()
+    client = app.test_client()
+    ids = {'venue_id': args.venues // 2 or 1, 'artist_id': args.artists // 2 or 1}
+    with app.app_context():
+        seed_database(args.venues, args.artists, args.shows, args.seed, reset=args.reset)
+    results = {
+        'environment': {
+            'database': database.split(':', 1)[0],
+            'python': platform.python_version(),
+            'venues': args.venues,
+            'artists': args.artists,
+            'shows': args.shows,
+            'seed': args.seed,
+        },
+        'routes': run_routes(client, counter, ids, args.repeat),
+        'load': run_load(app, counter, {'venues': args.venues, 'artists': args.artists},
+                         args.duration, args.concurrency, args.seed),
+    }
+
+    failures = []
+    if args.import_budget:
+        startup = results['startup'] = measure_startup()
+        total = startup['import_ms'] + startup['create_app_ms']
+        if total > args.import_budget:
+            failures.append(f'startup: {total:.0f}ms, budget {args.import_budget:.0f}ms')
+    if args.scale:
+        # Every route must issue the same number of statements on a larger
+        # data set; a count that grows with the data is an N+1.
+        with app.app_context():
+            seed_database(args.venues * args.scale, args.artists * args.scale,
+                          args.shows * args.scale, args.seed, reset=args.reset)
+        scaled = count_queries(client, counter, ids)
+        results['scaled_queries'] = scaled
+        failures += [f'{name}: {results["routes"][name]["queries"]} queries at 1x, {count} at {args.scale}x'
+                     for name, count in scaled.items() if count != results['routes'][name]['queries']]
+    if args.explain:
+        # Planners prefer a scan on small tables; pass a large --scale.
+        with app.app_context():
+            scans = check_plans(client, StatementRecorder(), ids)
+        results['sequential_scans'] = {name: [table for table, statement in found]
+                                       for name, found in scans.items()}
+        failures += [f'{name}: sequential scan on {table}: {statement}'
+                     for name, found in scans.items() for table, statement in found]
+
+    if args.compare and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            failures += regressions(results, json.load(f), args.tolerance, args.min_delta)
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+    for failure in failures:
+        print(f'REGRESSION {failure}', file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
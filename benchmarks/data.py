@@ -0,0 +1,121 @@
+# ----------------------------------------------------------------------------#
+# Deterministic synthetic data.
+# ----------------------------------------------------------------------------#
+# The same (venues, artists, shows, seed) always produces the same rows. Show
+# times are spread a year either side of midnight today, so roughly half of
+# them are upcoming whenever the benchmark runs.
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy.engine.url import make_url
+
+from forms import VenueForm
+from availability import booking_index
+from models import db, Venue, Artist, Show, venue_names, artist_names, venue_genres, artist_genres
+from summary import refresh_venues
+
+GENRES = [value for value, label in VenueForm.genres.kwargs['choices']]
+STATES = ['CA', 'NY', 'TX', 'IL', 'WA', 'LA', 'MA', 'CO']
+CITIES = ['San Francisco', 'New York', 'Austin', 'Chicago', 'Seattle', 'New Orleans', 'Boston', 'Denver']
+WORDS = ['Musical', 'Hop', 'Dueling', 'Pianos', 'Park', 'Square', 'Live', 'Coffee', 'Guns', 'Petals',
+         'Wild', 'Sax', 'Band', 'Blue', 'Note', 'Velvet', 'Lounge', 'Echo', 'Hall', 'Basement']
+
+
+def _name(rng, n):
+    return f'The {rng.choice(WORDS)} {rng.choice(WORDS)} {n}'
+
+
+def venues(count, rng):
+    for n in range(1, count + 1):
+        place = rng.randrange(len(CITIES))
+        yield {
+            'id': n,
+            'name': _name(rng, n),
+            'city': CITIES[place],
+            'state': STATES[place],
+            'address': f'{rng.randrange(1, 9999)} Main St',
+            'phone': f'{rng.randrange(200, 999)}-555-{rng.randrange(1000, 9999)}',
+            'image_link': f'https://img.example.com/venues/{n}.jpg',
+            'genres': rng.sample(GENRES, 2),
+            'facebook_link': f'https://www.facebook.com/venue{n}',
+            'website_link': f'https://venue{n}.example.com',
+            'seeking_talent': rng.random() < 0.5,
+            'seeking_description': 'Looking for local artists.',
+        }
+
+
+def artists(count, rng):
+    for n in range(1, count + 1):
+        place = rng.randrange(len(CITIES))
+        yield {
+            'id': n,
+            'name': _name(rng, n),
+            'city': CITIES[place],
+            'state': STATES[place],
+            'phone': f'{rng.randrange(200, 999)}-555-{rng.randrange(1000, 9999)}',
+            'image_link': f'https://img.example.com/artists/{n}.jpg',
+            'genres': rng.sample(GENRES, 2),
+            'facebook_link': f'https://www.facebook.com/artist{n}',
+            'website_link': f'https://artist{n}.example.com',
+            'seeking_venue': rng.random() < 0.5,
+            'seeking_description': 'Looking for shows.',
+        }
+
+
+def shows(count, venue_count, artist_count, rng, anchor):
+    for n in range(1, count + 1):
+        yield {
+            'id': n,
+            'venue_id': rng.randrange(1, venue_count + 1),
+            'artist_id': rng.randrange(1, artist_count + 1),
+            'start_time': anchor + timedelta(hours=rng.randrange(-365 * 24, 365 * 24)),
+        }
+
+
+def _insert(table, rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            db.session.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+
+
+def is_scratch(url):
+    # A SQLite database in memory or under the temporary directory.
+    url = make_url(str(url))
+    if url.get_backend_name() != 'sqlite':
+        return False
+    if url.database in (None, '', ':memory:'):
+        return True
+    return os.path.realpath(url.database).startswith(os.path.realpath(tempfile.gettempdir()) + os.sep)
+
+
+def seed_database(venue_count=200, artist_count=200, show_count=5000, seed=0, batch_size=5000, reset=False):
+    # Recreates the schema on the primary database and fills it. Needs an
+    # app context. Any database but a scratch one (is_scratch) is refused
+    # unless reset is given, since every table is dropped.
+    if not reset and not is_scratch(db.engine.url):
+        raise RuntimeError(f'seeding drops every table of {db.engine.url!r}; pass reset=True to confirm')
+    rng = random.Random(seed)
+    anchor = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    db.session.remove()
+    db.drop_all(bind=None)
+    db.create_all(bind=None)
+    _insert(Venue.__table__, venues(venue_count, rng), batch_size)
+    _insert(Artist.__table__, artists(artist_count, rng), batch_size)
+    _insert(Show.__table__, shows(show_count, venue_count, artist_count, rng, anchor), batch_size)
+    refresh_venues(db.session.connection())
+    db.session.commit()
+    # Fresh statistics, so the planner sees the table sizes EXPLAIN is
+    # checked against.
+    db.session.execute('ANALYZE')
+    db.session.commit()
+    db.session.remove()
+    # The rows went in through Core, which the in-memory indexes don't see.
+    for index in (venue_names, artist_names, venue_genres, artist_genres, booking_index):
+        index.invalidate()
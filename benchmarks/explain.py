@@ -0,0 +1,91 @@
+# ----------------------------------------------------------------------------#
+# Query plan check.
+# ----------------------------------------------------------------------------#
+# Records the statements each route issues and runs EXPLAIN on them. A plan
+# that reads one of the app's tables with a sequential scan is reported; on
+# a large data set that means a missing or unusable index.
+import json
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from benchmarks.routes import ROUTES, request
+from models import db
+
+TABLES = {'Venue', 'Artist', 'Show'}
+# The benchmark's one-letter searches match every row, where reading the whole
+# table is the right plan; plans are checked for a selective term instead.
+FORM_DATA = {
+    'search_venues': {'search_term': 'Velvet Echo'},
+    'search_artists': {'search_term': 'Velvet Echo'},
+}
+
+
+class StatementRecorder:
+    # Keeps (statement, parameters) for SELECTs run on this thread.
+
+    def __init__(self):
+        self._local = threading.local()
+        event.listen(Engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            self.statements.append((statement, parameters))
+
+    @property
+    def statements(self):
+        if not hasattr(self._local, 'statements'):
+            self._local.statements = []
+        return self._local.statements
+
+    def reset(self):
+        self._local.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+def _postgres_scans(plan):
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in TABLES:
+        yield plan['Relation Name']
+    for child in plan.get('Plans', ()):
+        yield from _postgres_scans(child)
+
+
+def sequential_scans(connection, statement, parameters):
+    # Tables the statement's plan reads with a full, unindexed scan.
+    if connection.dialect.name == 'postgresql':
+        result = connection.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+        plan = json.loads(result) if isinstance(result, str) else result
+        return sorted(set(_postgres_scans(plan[0]['Plan'])))
+    # SQLite: "SCAN <table>" without an index is a full table scan, unless it
+    # walks the rowid in ORDER BY order under a LIMIT and stops early.
+    plan = [row[-1].replace('SCAN TABLE ', 'SCAN ') for row in
+            connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+    bounded = ' LIMIT ' in statement and not any('FOR ORDER BY' in step for step in plan)
+    scans = set()
+    for step in plan:
+        words = step.split()
+        if words[:1] == ['SCAN'] and words[1].strip('"') in TABLES and 'INDEX' not in words \
+                and not bounded:
+            scans.add(words[1].strip('"'))
+    return sorted(scans)
+
+
+def check_plans(client, recorder, ids):
+    # Returns {route: [(table, statement), ...]} for every sequential scan.
+    failures = {}
+    for name, method, path, data in ROUTES:
+        path = path.format(**ids)
+        data = FORM_DATA.get(name, data)
+        # The second request is checked, as in count_queries.
+        request(client, recorder, method, path, data)
+        request(client, recorder, method, path, data)
+        statements = list(recorder.statements)
+        with db.engine.connect() as connection:
+            for statement, parameters in statements:
+                for table in sequential_scans(connection, statement, parameters):
+                    failures.setdefault(name, []).append((table, ' '.join(statement.split())))
+    return failures
@@ -0,0 +1,63 @@
+# ----------------------------------------------------------------------------#
+# Headless load scenario.
+# ----------------------------------------------------------------------------#
+# Worker threads replay the route mix through the WSGI app for a fixed time
+# and report throughput, latency percentiles and queries per request. To
+# drive a live server instead, use benchmarks/locustfile.py.
+import random
+import threading
+import time
+
+from benchmarks.routes import ROUTES, request
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_load(app, counter, ids, duration=10.0, concurrency=8, seed=0):
+    latencies, queries, errors = [], [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(n):
+        rng = random.Random(seed + n)
+        client = app.test_client()
+        mine, mine_queries, mine_errors = [], [], 0
+        while time.perf_counter() < deadline:
+            name, method, path, data = rng.choice(ROUTES)
+            path = path.format(venue_id=rng.randrange(1, ids['venues'] + 1),
+                               artist_id=rng.randrange(1, ids['artists'] + 1))
+            try:
+                elapsed, count = request(client, counter, method, path, data)
+            except Exception:
+                mine_errors += 1
+                continue
+            mine.append(elapsed * 1000)
+            mine_queries.append(count)
+        with lock:
+            latencies.extend(mine)
+            queries.extend(mine_queries)
+            errors.append(mine_errors)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'concurrency': concurrency,
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'queries_per_request': sum(queries) / max(len(queries), 1),
+    }
@@ -0,0 +1,27 @@
+# ----------------------------------------------------------------------------#
+# Locust scenario for a running server (pip install locust):
+#   locust -f benchmarks/locustfile.py --headless -u 50 -r 10 -t 1m \
+#       --host http://localhost:5000
+# Uses the same route mix as the in-process load scenario. Set
+# BENCH_VENUES / BENCH_ARTISTS to the seeded counts.
+# ----------------------------------------------------------------------------#
+import os
+import random
+
+from locust import HttpUser, between, task
+
+from benchmarks.routes import ROUTES
+
+VENUES = int(os.environ.get('BENCH_VENUES', 200))
+ARTISTS = int(os.environ.get('BENCH_ARTISTS', 200))
+
+
+class FyyurUser(HttpUser):
+    wait_time = between(0, 0.1)
+
+    @task
+    def browse(self):
+        name, method, path, data = random.choice(ROUTES)
+        path = path.format(venue_id=random.randrange(1, VENUES + 1),
+                           artist_id=random.randrange(1, ARTISTS + 1))
+        self.client.request(method, path, data=data, name=name)
@@ -0,0 +1,85 @@
+# ----------------------------------------------------------------------------#
+# Per-route microbenchmarks.
+# ----------------------------------------------------------------------------#
+import statistics
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# (name, method, path, form data). Paths are formatted with a venue_id and
+# artist_id picked from the middle of the seeded range.
+ROUTES = [
+    ('index', 'GET', '/', None),
+    ('venues', 'GET', '/venues', None),
+    ('search_venues', 'POST', '/venues/search', {'search_term': 'a'}),
+    ('show_venue', 'GET', '/venues/{venue_id}', None),
+    ('edit_venue', 'GET', '/venues/{venue_id}/edit', None),
+    ('artists', 'GET', '/artists', None),
+    ('search_artists', 'POST', '/artists/search', {'search_term': 'a'}),
+    ('show_artist', 'GET', '/artists/{artist_id}', None),
+    ('edit_artist', 'GET', '/artists/{artist_id}/edit', None),
+    ('shows', 'GET', '/shows', None),
+    ('availability', 'GET', '/api/v1/availability?venue={venue_id}&artist={artist_id}', None),
+]
+
+
+class QueryCounter:
+    # Counts statements per thread, across every engine.
+
+    def __init__(self):
+        self._local = threading.local()
+        event.listen(Engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+
+def request(client, counter, method, path, data):
+    # Returns (seconds, queries) for one request; raises on a non-2xx/3xx.
+    counter.reset()
+    started = time.perf_counter()
+    response = client.open(path, method=method, data=data)
+    response.get_data()
+    elapsed = time.perf_counter() - started
+    if response.status_code >= 400:
+        raise RuntimeError(f'{method} {path} returned {response.status_code}')
+    return elapsed, counter.count
+
+
+def run_routes(client, counter, ids, repeat=20, warmup=2):
+    results = {}
+    for name, method, path, data in ROUTES:
+        path = path.format(**ids)
+        for _ in range(warmup):
+            request(client, counter, method, path, data)
+        timings, queries = [], 0
+        for _ in range(repeat):
+            elapsed, queries = request(client, counter, method, path, data)
+            timings.append(elapsed * 1000)
+        results[name] = {
+            'median_ms': statistics.median(timings),
+            'min_ms': min(timings),
+            'max_ms': max(timings),
+            'queries': queries,
+        }
+    return results
+
+
+def count_queries(client, counter, ids):
+    # Statements issued by one request to each route, after a warm-up
+    # request (which may load lazily built state such as search indexes).
+    counts = {}
+    for name, method, path, data in ROUTES:
+        path = path.format(**ids)
+        request(client, counter, method, path, data)
+        counts[name] = request(client, counter, method, path, data)[1]
+    return counts
@@ -0,0 +1,167 @@
+# ----------------------------------------------------------------------------#
+# Show booking.
+# ----------------------------------------------------------------------------#
+# book_shows() lists any number of (artist_id, venue_id, start_time) rows in
+# one transaction, with a fixed number of statements per batch:
+#   * references: one `id IN (...)` read per table checks every artist and
+#     venue at once (and locks them on Postgres, so concurrent bookings for
+#     the same venue or artist queue up instead of both passing the checks);
+#   * double bookings: a show holds its venue and artist for SHOW_DURATION
+#     minutes. One range read per side, on the (venue_id, start_time) and
+#     (artist_id, start_time) indexes, loads the shows already booked around
+#     the batch's time span; each row is then checked by bisecting those
+#     start times, together with the rows accepted before it, so clashes
+#     inside the batch are caught too;
+#   * the accepted rows go in as multi-row INSERTs, and the availability
+#     index (availability.py) picks them up right after the commit, which
+#     then emits shows.created (jobs.py).
+# Errors are reported per row ({"row": index, "errors": {field: [message]}}).
+# By default one bad row fails the whole batch; partial=True lists the rest.
+#
+# Config:
+#   SHOW_DURATION  minutes a show holds its venue and artist
+#   TIMEZONE       zone that times with an offset are converted to
+from bisect import bisect_right, insort
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytz
+from flask import current_app
+
+from availability import booking_index
+from cache import cache
+from jobs import jobs
+from models import db, Venue, Artist, Show, insert_rows
+from summary import refresh_venues
+
+# Ids per IN list; well under SQLite's bound variable limit.
+CHUNK_SIZE = 500
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def parse_start_time(value, zone):
+    if isinstance(value, datetime):
+        start = value
+    else:
+        start = datetime.fromisoformat(str(value).strip())
+    if start.tzinfo is not None:
+        start = start.astimezone(zone).replace(tzinfo=None)
+    return start
+
+
+def parse_row(record, zone):
+    # Returns (row, errors) for one submitted record.
+    if not hasattr(record, 'get'):
+        return None, {'row': ['Expected an object with artist_id, venue_id and start_time.']}
+    row, errors = {}, {}
+    for field in ('artist_id', 'venue_id'):
+        try:
+            row[field] = int(record.get(field))
+        except (TypeError, ValueError):
+            errors[field] = ['Not a valid id.']
+    try:
+        row['start_time'] = parse_start_time(record.get('start_time'), zone)
+    except (TypeError, ValueError):
+        errors['start_time'] = ['Not a valid date and time (YYYY-MM-DD HH:MM:SS).']
+    return row, errors
+
+
+def existing_ids(model, ids):
+    # Ordered, so concurrent batches take their row locks in the same order.
+    found = set()
+    for chunk in _chunks(sorted(ids)):
+        query = db.session.query(model.id).filter(model.id.in_(chunk)).order_by(model.id)
+        found.update(id for id, in query.with_for_update())
+    return found
+
+
+def booked_starts(column, ids, earliest, latest):
+    # {id: sorted start times} of the shows at those venues (or by those
+    # artists) starting strictly between earliest and latest.
+    booked = defaultdict(list)
+    for chunk in _chunks(sorted(ids)):
+        query = db.session.query(column, Show.start_time) \
+            .filter(column.in_(chunk), Show.start_time > earliest, Show.start_time < latest)
+        for id, start in query:
+            booked[id].append(start)
+    for starts in booked.values():
+        starts.sort()
+    return booked
+
+
+def overlaps(starts, start, duration):
+    # Whether any of the sorted starts is less than `duration` from start.
+    i = bisect_right(starts, start - duration)
+    return i < len(starts) and starts[i] < start + duration
+
+
+def book_shows(records, partial=False, duration=None):
+    # Returns (number of shows listed, per-row errors).
+    config = current_app.config
+    duration = duration or timedelta(minutes=config.get('SHOW_DURATION', 180))
+    zone = pytz.timezone(config.get('TIMEZONE', 'UTC'))
+
+    errors = {}
+    rows = {}
+    for index, record in enumerate(records):
+        row, row_errors = parse_row(record, zone)
+        if row_errors:
+            errors[index] = row_errors
+        else:
+            rows[index] = row
+    if errors and not partial:
+        return 0, _report(errors)
+
+    try:
+        if rows:
+            venues = existing_ids(Venue, {row['venue_id'] for row in rows.values()})
+            artists = existing_ids(Artist, {row['artist_id'] for row in rows.values()})
+            earliest = min(row['start_time'] for row in rows.values()) - duration
+            latest = max(row['start_time'] for row in rows.values()) + duration
+            at_venue = booked_starts(Show.venue_id, venues, earliest, latest)
+            by_artist = booked_starts(Show.artist_id, artists, earliest, latest)
+
+        accepted = []
+        for index, row in sorted(rows.items()):
+            row_errors = {}
+            venue_id, artist_id, start = row['venue_id'], row['artist_id'], row['start_time']
+            if venue_id not in venues:
+                row_errors['venue_id'] = [f'There is no venue {venue_id}.']
+            elif overlaps(at_venue[venue_id], start, duration):
+                row_errors['venue_id'] = [f'Venue {venue_id} already has a show within {duration} of {start}.']
+            if artist_id not in artists:
+                row_errors['artist_id'] = [f'There is no artist {artist_id}.']
+            elif overlaps(by_artist[artist_id], start, duration):
+                row_errors['artist_id'] = [f'Artist {artist_id} already has a show within {duration} of {start}.']
+            if row_errors:
+                errors[index] = row_errors
+                continue
+            insort(at_venue[venue_id], start)
+            insort(by_artist[artist_id], start)
+            accepted.append(row)
+
+        if not accepted or (errors and not partial):
+            db.session.rollback()
+            return 0, _report(errors)
+        insert_rows(Show.__table__, accepted)
+        # Core inserts skip the flush hook that keeps VenueSummary current.
+        venue_ids = {row['venue_id'] for row in accepted}
+        artist_ids = {row['artist_id'] for row in accepted}
+        refresh_venues(db.session.connection(), venue_ids)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    cache.delete(*[f'venue:{id}' for id in venue_ids], *[f'artist:{id}' for id in artist_ids])
+    booking_index.sync()
+    jobs.emit('shows.created', venue_ids=sorted(venue_ids), artist_ids=sorted(artist_ids))
+    return len(accepted), _report(errors)
+
+
+def _report(errors):
+    return [{'row': index, 'errors': errors[index]} for index in sorted(errors)]
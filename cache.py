@@ -0,0 +1,200 @@
+# ----------------------------------------------------------------------------#
+# Read-through cache for rendered page payloads.
+# ----------------------------------------------------------------------------#
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class LRUCache:
+    # In-process cache: least recently used entries are evicted once maxsize
+    # is reached, and every entry expires after its ttl (seconds). A delete
+    # only reaches the process that makes it, so Cache refuses it as the page
+    # cache of more than one worker.
+    shared = False
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.expirations += 1
+            self.misses += 1
+            return MISSING
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            "backend": "lru",
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class RedisCache:
+    # Shared cache for multi-worker deployments. Works with any server that
+    # speaks the Redis protocol; needs the optional `redis` package.
+    shared = True
+
+    def __init__(self, url, ttl=300, prefix='fyyur:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_TYPE = "redis" requires the redis package')
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return MISSING
+        self.hits += 1
+        return pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, pickle.dumps(value), px=max(int(ttl * 1000), 1))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.client.info('stats').get('evicted_keys', 0),
+        }
+
+
+class NullCache:
+    shared = False
+
+    def get(self, key):
+        return MISSING
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {"backend": "null"}
+
+
+class Cache:
+    # Backend is picked from the app config:
+    #   CACHE_TYPE       'lru' (default), 'redis' or 'null'; 'lru' is for a
+    #                    single worker process (WEB_CONCURRENCY=1)
+    #   CACHE_MAXSIZE    entries kept by the lru backend
+    #   CACHE_TTL        default time to live, in seconds
+    #   CACHE_REDIS_URL  server for the redis backend
+
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get('CACHE_TYPE', 'lru')
+        ttl = app.config.get('CACHE_TTL', 300)
+        if kind == 'lru':
+            workers = app.config.get('WEB_CONCURRENCY', 1)
+            if workers > 1:
+                # The other workers would keep serving pages this one
+                # invalidated until they expire.
+                raise RuntimeError(f'CACHE_TYPE = "lru" is per process; with WEB_CONCURRENCY={workers} '
+                                   'use "redis" (or "null")')
+            self.backend = LRUCache(app.config.get('CACHE_MAXSIZE', 1024), ttl)
+        elif kind == 'redis':
+            self.backend = RedisCache(app.config['CACHE_REDIS_URL'], ttl)
+        elif kind == 'null':
+            self.backend = NullCache()
+        else:
+            raise ValueError(f'unknown CACHE_TYPE {kind!r}')
+        app.extensions['cache'] = self
+
+    def get_or_set(self, key, load, ttl=None):
+        # Returns the cached value for key, or calls load() and caches its
+        # result. None results are not cached. ttl may be a callable taking
+        # the loaded value.
+        value = self.backend.get(key)
+        if value is MISSING:
+            value = load()
+            if value is not None:
+                self.backend.set(key, value, ttl(value) if callable(ttl) else ttl)
+        return value
+
+    def get(self, key):
+        # The cached value for key, or None.
+        value = self.backend.get(key)
+        return None if value is MISSING else value
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl(value) if callable(ttl) else ttl)
+
+    def delete(self, *keys):
+        self.backend.delete(*keys)
+
+    def clear(self):
+        self.backend.clear()
+
+    @property
+    def shared(self):
+        # Whether other processes see this one's entries.
+        return self.backend.shared
+
+    def stats(self):
+        return self.backend.stats()
+
+
+cache = Cache()
@@ -0,0 +1,371 @@
+# ----------------------------------------------------------------------------#
+# flask fyyur ... commands.
+# ----------------------------------------------------------------------------#
+import csv
+import json
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from werkzeug.datastructures import MultiDict
+
+from assets import build as build_assets
+from cache import cache
+from forms import VenueForm, ArtistForm, ShowForm
+from jobs import jobs
+from models import db, Venue, Artist, Show, venue_names, artist_names, venue_genres, artist_genres, insert_rows
+from partitions import add_months, archive_shows, create_partitions, is_partitioned, month_start
+from summary import refresh_venues, stale_venues
+
+fyyur_cli = AppGroup('fyyur', help='Fyyur maintenance commands.')
+
+# Columns read and written per kind, in file order.
+FIELDS = {
+    'venues': ['id', 'name', 'city', 'state', 'address', 'phone', 'image_link', 'genres',
+               'facebook_link', 'website_link', 'seeking_talent', 'seeking_description'],
+    'artists': ['id', 'name', 'city', 'state', 'phone', 'image_link', 'genres',
+                'facebook_link', 'website_link', 'seeking_venue', 'seeking_description'],
+    'shows': ['id', 'artist_id', 'venue_id', 'start_time'],
+}
+MODELS = {'venues': Venue, 'artists': Artist, 'shows': Show}
+FORMS = {'venues': VenueForm, 'artists': ArtistForm, 'shows': ShowForm}
+KINDS = click.Choice(sorted(FIELDS))
+FORMATS = click.Choice(['csv', 'ndjson'])
+
+
+def _format_for(path, fmt):
+    if fmt:
+        return fmt
+    return 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Progress:
+    # Rows-per-second reporting on stderr.
+
+    def __init__(self, verb):
+        self.verb = verb
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    def add(self, rows):
+        self.rows += rows
+        click.echo(f'{self.verb} {self.rows} rows ({self.rate():,.0f} rows/s)', err=True)
+
+    def rate(self):
+        return self.rows / max(time.perf_counter() - self.started, 1e-9)
+
+
+#  Import
+#  ----------------------------------------------------------------
+
+def read_records(stream, fmt):
+    # Yields one dict per record without loading the whole file.
+    if fmt == 'csv':
+        for record in csv.DictReader(stream):
+            yield record
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+# Checkbox columns, and the spellings of false they accept. A WTForms
+# BooleanField reads any other submitted value (CSV "False", "0") as true,
+# so these are left out of the form data instead.
+BOOLEANS = {'seeking_talent', 'seeking_venue'}
+FALSE_VALUES = {'', '0', 'false', 'f', 'no', 'n', 'off'}
+
+
+def _formdata(record):
+    formdata = MultiDict()
+    for key, value in record.items():
+        if value is None or value is False or key is None:
+            continue
+        if key in BOOLEANS and isinstance(value, str) and value.strip().lower() in FALSE_VALUES:
+            continue
+        if value is True:
+            value = 'y'
+        if key == 'genres':
+            if isinstance(value, str):
+                value = [genre.strip() for genre in value.split(',') if genre.strip()]
+            formdata.setlist(key, value)
+        else:
+            formdata[key] = value if isinstance(value, str) else str(value)
+    return formdata
+
+
+def validate(kind, record):
+    # Applies the same rules as the web forms; returns (row, errors).
+    form = FORMS[kind](formdata=_formdata(record), meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+    row = {name: form[name].data for name in FIELDS[kind] if name in form}
+    try:
+        if record.get('id') not in (None, ''):
+            row['id'] = int(record['id'])
+        if kind == 'shows':
+            if not record.get('start_time'):
+                return None, {'start_time': ['This field is required.']}
+            row['artist_id'] = int(row['artist_id'])
+            row['venue_id'] = int(row['venue_id'])
+    except (TypeError, ValueError) as error:
+        return None, {'id': [str(error)]}
+    return row, None
+
+
+def resolve_show_refs(batch):
+    # Shows may name their artist and venue instead of giving ids; resolve
+    # each batch's names with one query per table.
+    refs = {'artist': (Artist, {}), 'venue': (Venue, {})}
+    for record in batch:
+        for side, (model, names) in refs.items():
+            name = record.get(f'{side}_name')
+            if name and not record.get(f'{side}_id'):
+                names[name] = None
+    for side, (model, names) in refs.items():
+        if names:
+            for id, name in db.session.query(model.id, model.name).filter(model.name.in_(list(names))):
+                names[name] = id
+        for record in batch:
+            name = record.get(f'{side}_name')
+            if name and not record.get(f'{side}_id') and names.get(name) is not None:
+                record[f'{side}_id'] = str(names[name])
+
+
+def check_show_refs(rows):
+    # Returns the set of row indexes whose artist or venue does not exist.
+    bad = set()
+    for side, model in (('artist', Artist), ('venue', Venue)):
+        ids = {row[f'{side}_id'] for row in rows}
+        found = {id for id, in db.session.query(model.id).filter(model.id.in_(ids))}
+        bad.update(n for n, row in enumerate(rows) if row[f'{side}_id'] not in found)
+    return bad
+
+
+def _reset_sequence(table):
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(
+            f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM \"{table.name}\"), 1))")
+
+
+@fyyur_cli.command('import')
+@click.argument('kind', type=KINDS)
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=FORMATS, help='Defaults from the file extension.')
+@click.option('--batch-size', default=2000, show_default=True)
+def import_command(kind, source, fmt, batch_size):
+    """Import venues, artists or shows from CSV or NDJSON (- for stdin).
+
+    Rows are validated against the web forms and inserted in batches; shows
+    may reference their artist and venue by artist_name / venue_name.
+    """
+    fmt = _format_for(source.name, fmt)
+    table = MODELS[kind].__table__
+    progress = Progress('imported')
+    failed = 0
+    explicit_ids = False
+    records = enumerate(read_records(source, fmt), start=1)
+    for batch in _batches(records, batch_size):
+        if kind == 'shows':
+            resolve_show_refs([record for n, record in batch])
+        rows, lines = [], []
+        for n, record in batch:
+            row, errors = validate(kind, record)
+            if errors:
+                failed += 1
+                click.echo(f'record {n}: {errors}', err=True)
+                continue
+            explicit_ids = explicit_ids or 'id' in row
+            rows.append(row)
+            lines.append(n)
+        if kind == 'shows' and rows:
+            for index in sorted(check_show_refs(rows), reverse=True):
+                failed += 1
+                click.echo(f'record {lines[index]}: unknown artist or venue', err=True)
+                del rows[index]
+        if rows:
+            insert_rows(table, rows)
+            db.session.commit()
+        progress.add(len(rows))
+    if explicit_ids:
+        _reset_sequence(table)
+        db.session.commit()
+    # Bulk inserts bypass the ORM events that keep these up to date.
+    if kind in ('venues', 'shows'):
+        refresh_venues(db.session.connection())
+        db.session.commit()
+    venue_names.invalidate()
+    artist_names.invalidate()
+    venue_genres.invalidate()
+    artist_genres.invalidate()
+    cache.clear()
+    click.echo(f'{progress.rows} {kind} imported, {failed} rejected, '
+               f'{progress.rate():,.0f} rows/s', err=True)
+    if failed:
+        sys.exit(1)
+
+
+#  Schema
+#  ----------------------------------------------------------------
+
+@fyyur_cli.command('init-db')
+@click.option('--drop', is_flag=True, help='Drop the existing tables first.')
+def init_db_command(drop):
+    """Create the schema on an empty database (local SQLite, scratch copies).
+
+    Tables are created from the models and the database is stamped with the
+    latest migration, so `flask db upgrade` picks up from there. Shared
+    databases are created and upgraded with `flask db upgrade` alone.
+    """
+    from flask_migrate import stamp
+    if drop:
+        db.drop_all(bind=None)
+    db.create_all(bind=None)
+    stamp()
+    click.echo('schema created at the latest migration', err=True)
+
+
+#  Assets
+#  ----------------------------------------------------------------
+
+@fyyur_cli.command('build-assets')
+def build_assets_command():
+    """Bundle, fingerprint and pre-compress static/ into static/dist/.
+
+    Run on every deploy, before the workers start; they read the manifest
+    once, at startup.
+    """
+    manifest = build_assets(current_app.static_folder, current_app.static_url_path,
+                            current_app.config.get('ASSETS_DIR', 'dist'))
+    click.echo(f'built {len(manifest)} assets', err=True)
+
+
+#  Summaries
+#  ----------------------------------------------------------------
+
+@fyyur_cli.command('refresh-venues')
+@click.option('--all', 'everything', is_flag=True, help='Recompute every row, not only stale ones.')
+def refresh_venues_command(everything):
+    """Recompute /venues summary rows whose next show has started.
+
+    Reads stay correct without it; running it from cron keeps them on the
+    precomputed path.
+    """
+    connection = db.session.connection()
+    venue_ids = None if everything else stale_venues(connection)
+    refresh_venues(connection, venue_ids)
+    db.session.commit()
+    count = 'all' if venue_ids is None else len(venue_ids)
+    click.echo(f'refreshed {count} venue summaries', err=True)
+
+
+@fyyur_cli.command('partition-shows')
+@click.option('--ahead', type=int, help='Months of partitions to keep past the current one '
+                                         '[default: SHOW_PARTITIONS_AHEAD].')
+@click.option('--archive-after', type=int, help='Archive shows from months that ended this many months ago '
+                                                 '[default: SHOW_ARCHIVE_MONTHS; 0 archives nothing].')
+@click.option('--detach', is_flag=True, help='Detach old partitions instead of moving their shows to ShowArchive.')
+def partition_shows_command(ahead, archive_after, detach):
+    """Create upcoming Show partitions and archive old shows.
+
+    Run it from cron (daily is plenty) so new months always have a partition
+    before their first booking.
+    """
+    config = current_app.config
+    ahead = config.get('SHOW_PARTITIONS_AHEAD', 12) if ahead is None else ahead
+    archive_after = config.get('SHOW_ARCHIVE_MONTHS', 36) if archive_after is None else archive_after
+    current = month_start(datetime.now())
+    connection = db.session.connection()
+    if is_partitioned(connection):
+        created = create_partitions(connection, current, add_months(current, ahead))
+        click.echo(f'created {len(created)} partitions {" ".join(created)}'.rstrip(), err=True)
+    moved, detached = 0, []
+    if archive_after:
+        try:
+            moved, detached = archive_shows(connection, add_months(current, -archive_after), detach)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+    db.session.commit()
+    if moved or detached:
+        cache.clear()
+    click.echo(f'archived {moved} shows', err=True)
+    for name in detached:
+        click.echo(f'detached {name}', err=True)
+
+
+#  Jobs
+#  ----------------------------------------------------------------
+
+@fyyur_cli.command('jobs')
+@click.option('--retry-dead', is_flag=True, help='Requeue the jobs that ran out of attempts first.')
+def jobs_command(retry_dead):
+    """Show the background job queue.
+
+    Depths are for the whole queue; throughput counters only cover this
+    process, so they read zero here (see /__debug__/jobs on a web worker).
+    """
+    if retry_dead:
+        click.echo(f'requeued {jobs.retry_dead()} dead jobs', err=True)
+    for name, value in jobs.stats().items():
+        click.echo(f'{name}: {value}')
+
+
+#  Export
+#  ----------------------------------------------------------------
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+@fyyur_cli.command('export')
+@click.argument('kind', type=KINDS)
+@click.argument('target', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--format', 'fmt', type=FORMATS, help='Defaults from the file extension.')
+@click.option('--batch-size', default=2000, show_default=True)
+def export_command(kind, target, fmt, batch_size):
+    """Export venues, artists or shows as CSV or NDJSON (stdout by default).
+
+    Rows are streamed from a server-side cursor, batch_size at a time.
+    """
+    fmt = _format_for(target.name, fmt)
+    table = MODELS[kind].__table__
+    fields = FIELDS[kind]
+    columns = [table.c[name] for name in fields]
+    rows = (
+        db.session.query(*columns)
+        .order_by(table.c.id)
+        .execution_options(stream_results=True)
+        .yield_per(batch_size)
+    )
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(target)
+        writer.writerow(fields)
+    progress = Progress('exported')
+    for batch in _batches(rows, batch_size):
+        for row in batch:
+            values = [_plain(value) for value in row]
+            if writer is not None:
+                if 'genres' in fields:
+                    genres = fields.index('genres')
+                    values[genres] = ','.join(values[genres] or [])
+                writer.writerow(values)
+            else:
+                target.write(json.dumps(dict(zip(fields, values))) + '\n')
+        progress.add(len(batch))
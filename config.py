@@ -1,13 +1,162 @@
 import os
-SECRET_KEY = os.urandom(32)
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+# Profile: 'development', 'production' or 'pgbouncer'. Every setting below
+# can also be overridden through the environment.
+FYYUR_ENV = os.environ.get('FYYUR_ENV', 'development')
+
 # Enable debug mode.
-DEBUG = True
+DEBUG = FYYUR_ENV == 'development'
 
 # Connect to the database
 
 
 # DONE IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql://postgres@localhost:5432/fyyurdb'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://postgres@localhost:5432/fyyurdb')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Connection pool. Each worker process gets its own pool, so under gunicorn
+# the database sees up to WEB_CONCURRENCY * (pool_size + max_overflow)
+# connections; keep that below the server's max_connections. The pgbouncer
+# profile leaves pooling to PgBouncer and opens a connection per checkout.
+POOL_PROFILES = {
+    'development': {
+        'pool_size': 5,
+        'max_overflow': 5,
+        'pool_timeout': 10,
+        'pool_recycle': 1800,
+        'pool_pre_ping': True,
+        'statement_timeout_ms': 0,
+    },
+    'production': {
+        'pool_size': 5,
+        'max_overflow': 10,
+        'pool_timeout': 30,
+        'pool_recycle': 1800,
+        'pool_pre_ping': True,
+        'statement_timeout_ms': 30000,
+    },
+    'pgbouncer': {
+        'pool_size': None,
+        'pool_pre_ping': False,
+        'statement_timeout_ms': 0,
+    },
+}
+
+
+def _env(name, default, cast=int):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    if cast is bool:
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return cast(value)
+
+
+def engine_options(uri, profile):
+    # Builds SQLALCHEMY_ENGINE_OPTIONS for uri from the named pool profile,
+    # with DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    # DB_POOL_PRE_PING and DB_STATEMENT_TIMEOUT_MS overriding it.
+    if profile not in POOL_PROFILES:
+        raise RuntimeError(f'FYYUR_ENV={profile!r} is not a profile; use one of {", ".join(sorted(POOL_PROFILES))}')
+    settings = POOL_PROFILES[profile]
+    if not uri.startswith('postgresql'):
+        # SQLite picks its own pool class, which takes none of these.
+        return {}
+    options = {'pool_pre_ping': _env('DB_POOL_PRE_PING', settings['pool_pre_ping'], bool)}
+    pool_size = _env('DB_POOL_SIZE', settings['pool_size'])
+    if pool_size is None:
+        from sqlalchemy.pool import NullPool
+        options['poolclass'] = NullPool
+    else:
+        # A profile without pooling (pgbouncer) given a DB_POOL_SIZE starts
+        # from QueuePool's own defaults.
+        options.update(
+            pool_size=pool_size,
+            max_overflow=_env('DB_MAX_OVERFLOW', settings.get('max_overflow', 10)),
+            pool_timeout=_env('DB_POOL_TIMEOUT', settings.get('pool_timeout', 30)),
+            pool_recycle=_env('DB_POOL_RECYCLE', settings.get('pool_recycle', -1)),
+        )
+    statement_timeout = _env('DB_STATEMENT_TIMEOUT_MS', settings['statement_timeout_ms'])
+    if statement_timeout:
+        # PgBouncer rejects unknown startup parameters; set the timeout on
+        # the database role instead when running behind it.
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+
+SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, FYYUR_ENV)
+
+# Read replicas, as a comma separated DATABASE_REPLICA_URLS. GET requests are
+# spread over them; see routing.py.
+SQLALCHEMY_BINDS = {
+    f'replica_{n}': uri
+    for n, uri in enumerate(u for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u)
+}
+REPLICA_READ_YOUR_WRITES = _env('REPLICA_READ_YOUR_WRITES', 5)
+REPLICA_HEALTH_INTERVAL = _env('REPLICA_HEALTH_INTERVAL', 5)
+
+# The async entry point (asgi.py); by default the primary database over asyncpg.
+ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')
+ASGI_RENDER_THREADS = _env('ASGI_RENDER_THREADS', 4)
+
+# Used by the startup pool check to warn before the workers can exhaust the
+# server's connections.
+WEB_CONCURRENCY = _env('WEB_CONCURRENCY', 1)
+DB_MAX_CONNECTIONS = _env('DB_MAX_CONNECTIONS', 100)
+
+# Per-request query counts, DB and render time; see profiling.py.
+SQL_PROFILING = _env('SQL_PROFILING', DEBUG, bool)
+SQL_PROFILING_N_PLUS_ONE = 5
+
+# Page cache: 'lru' (in-process), 'redis' or 'null'; see cache.py. 'lru' only
+# serves a single worker process, so it is the default only without a Redis
+# URL, and startup fails when it is combined with WEB_CONCURRENCY > 1.
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+CACHE_TYPE = os.environ.get('CACHE_TYPE', 'redis' if CACHE_REDIS_URL else 'lru')
+CACHE_MAXSIZE = 1024
+CACHE_TTL = 300
+
+# Rendered template fragments ({% cache %}) and compiled templates; see
+# fragments.py.
+FRAGMENT_CACHE_MAXSIZE = _env('FRAGMENT_CACHE_MAXSIZE', 10000)
+FRAGMENT_CACHE_TTL = _env('FRAGMENT_CACHE_TTL', 3600)
+JINJA_BYTECODE_CACHE = os.environ.get('JINJA_BYTECODE_CACHE', os.path.join(basedir, '.jinja-cache'))
+
+# Fingerprinted, pre-compressed static files; see assets.py.
+ASSETS_DIR = 'dist'
+ASSETS_MAX_AGE = 365 * 24 * 3600
+
+# Date display; see formatting.py. Stored show times are naive, in TIMEZONE.
+LOCALES = [locale for locale in os.environ.get('LOCALES', 'en').split(',') if locale]
+TIMEZONE = os.environ.get('TIMEZONE', 'UTC')
+TIMEZONE_COOKIE = 'fyyur_tz'
+
+# Minutes a show holds its venue and artist; see bookings.py.
+SHOW_DURATION = _env('SHOW_DURATION', 180)
+
+# Show partitions and archive; see partitions.py. SHOW_ARCHIVE_MONTHS=0
+# keeps every show in Show.
+SHOW_HISTORY_MONTHS = _env('SHOW_HISTORY_MONTHS', 12)
+SHOW_PARTITIONS_AHEAD = _env('SHOW_PARTITIONS_AHEAD', 12)
+SHOW_ARCHIVE_MONTHS = _env('SHOW_ARCHIVE_MONTHS', 36)
+
+# In-memory booking index behind /api/v1/availability; see availability.py.
+AVAILABILITY_SYNC_INTERVAL = _env('AVAILABILITY_SYNC_INTERVAL', 1)
+AVAILABILITY_REBUILD_INTERVAL = _env('AVAILABILITY_REBUILD_INTERVAL', 600)
+
+# Background job queue; see jobs.py. JOBS_WORKERS=0 runs hooks inline.
+JOBS_DATABASE = os.environ.get('JOBS_DATABASE', os.path.join(basedir, '.jobs.sqlite3'))
+JOBS_WORKERS = _env('JOBS_WORKERS', 2)
+JOBS_MAX_ATTEMPTS = _env('JOBS_MAX_ATTEMPTS', 5)
+JOBS_RETRY_DELAY = _env('JOBS_RETRY_DELAY', 10)
+JOBS_LOCK_TIMEOUT = _env('JOBS_LOCK_TIMEOUT', 300)
+JOBS_POLL_INTERVAL = _env('JOBS_POLL_INTERVAL', 1)
+
+# Prometheus metrics at /metrics, off by default; see metrics.py. The endpoint
+# needs no login, so serve it only where Prometheus scrapes it. Point every
+# worker process at the same METRICS_DIR and empty it before the server starts.
+METRICS = _env('METRICS', False, bool)
+METRICS_DIR = os.environ.get('METRICS_DIR')
@@ -13,6 +13,13 @@ def test():
         abort("Aborted at user request.")
 
 
+def bench():
+    with settings(warn_only=True):
+        result = local("python -m benchmarks --compare", capture=True)
+    if result.failed and not confirm("Benchmarks regressed. Continue?"):
+        abort("Aborted at user request.")
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -24,6 +31,7 @@ def push():
 
 def prepare():
     test()
+    bench()
     commit()
     push()
 
@@ -0,0 +1,155 @@
+# ----------------------------------------------------------------------------#
+# Date formatting.
+# ----------------------------------------------------------------------------#
+# Backs the `datetime` template filter. Values that already are datetimes
+# skip parsing, Babel patterns and locales are parsed once and cached, and
+# preformat() formats a whole list of rows before rendering: the locale,
+# timezone and pattern are resolved once for the batch, and field values
+# shared between rows (the same day, the same time of day) are computed once.
+# The filter passes preformatted values through untouched.
+#
+# Config:
+#   LOCALES          locales offered; each request gets its Accept-Language
+#                    best match, or the first one
+#   TIMEZONE         zone of the naive times stored in the database
+#   TIMEZONE_COOKIE  cookie holding an IANA zone name to show times in
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+
+import dateutil.parser
+import pytz
+from babel import Locale, UnknownLocaleError
+from babel.dates import DateTimeFormat, parse_pattern
+from flask import g, has_request_context, request
+
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+# Pattern fields that depend on the date alone, and on the time of day alone.
+DATE_FIELDS = set('GyYuUQqMLwWdDFgEec')
+TIME_FIELDS = set('aBbhHKkmsSA')
+
+
+@lru_cache(maxsize=256)
+def compiled_pattern(format):
+    return parse_pattern(FORMATS.get(format, format))
+
+
+@lru_cache(maxsize=64)
+def load_locale(name):
+    return Locale.parse(name)
+
+
+class Formatted(str):
+    # A datetime formatted ahead of rendering, remembering its source value
+    # and format so the filter can pass it through.
+
+    def __new__(cls, text, value, format):
+        formatted = super().__new__(cls, text)
+        formatted.value = value
+        formatted.format = format
+        return formatted
+
+
+class _Fields:
+    # The mapping a DateTimePattern's format string is applied to. Field
+    # values are memoized per batch on the part of the datetime they read.
+
+    def __init__(self, memo, locale):
+        self.memo = memo
+        self.locale = locale
+        self.value = None
+
+    def __getitem__(self, name):
+        if name[0] in DATE_FIELDS:
+            key = (name, self.value.date())
+        elif name[0] in TIME_FIELDS:
+            key = (name, self.value.time())
+        else:
+            key = (name, self.value)
+        if key not in self.memo:
+            self.memo[key] = DateTimeFormat(self.value, self.locale)[name]
+        return self.memo[key]
+
+
+class DateFormatter:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.locales = app.config.get('LOCALES', ['en'])
+        self.timezone = pytz.timezone(app.config.get('TIMEZONE', 'UTC'))
+        self.cookie = app.config.get('TIMEZONE_COOKIE', 'fyyur_tz')
+        app.extensions['formatter'] = self
+        app.jinja_env.filters['datetime'] = self.format_datetime
+
+    # Per-request settings, resolved once per request.
+
+    def locale(self):
+        if not has_request_context():
+            return load_locale(self.locales[0])
+        if 'formatting_locale' not in g:
+            name = request.accept_languages.best_match(self.locales) or self.locales[0]
+            try:
+                g.formatting_locale = load_locale(name)
+            except (ValueError, UnknownLocaleError):
+                g.formatting_locale = load_locale(self.locales[0])
+        return g.formatting_locale
+
+    def display_timezone(self):
+        if not has_request_context():
+            return self.timezone
+        if 'formatting_timezone' not in g:
+            try:
+                g.formatting_timezone = pytz.timezone(request.cookies.get(self.cookie) or self.timezone.zone)
+            except pytz.UnknownTimeZoneError:
+                g.formatting_timezone = self.timezone
+        return g.formatting_timezone
+
+    # Formatting.
+
+    def _localize(self, value, zone):
+        if not isinstance(value, datetime):
+            value = dateutil.parser.parse(value)
+        if zone is self.timezone and value.tzinfo is None:
+            return value
+        if value.tzinfo is None:
+            value = self.timezone.localize(value)
+        return zone.normalize(value.astimezone(zone))
+
+    def format_many(self, values, format='medium'):
+        # Returns the formatted strings for an iterable of datetimes.
+        pattern = compiled_pattern(format)
+        zone = self.display_timezone()
+        fields = _Fields({}, self.locale())
+        formatted = []
+        for value in values:
+            fields.value = self._localize(value, zone)
+            formatted.append(pattern.format % fields)
+        return formatted
+
+    def format_datetime(self, value, format='medium'):
+        if isinstance(value, Formatted):
+            if value.format == format:
+                return value
+            value = value.value
+        return self.format_many([value], format)[0]
+
+    def preformat(self, rows, field, format='medium', batch_size=500):
+        # Yields each row as a dict with `field` already formatted, a batch
+        # at a time, so streamed listings stay lazy. Rows may be dicts or
+        # keyed result rows; they are not modified.
+        rows = iter(rows)
+        while True:
+            batch = [row if isinstance(row, dict) else row._asdict()
+                     for row in islice(rows, batch_size)]
+            if not batch:
+                return
+            texts = self.format_many([row[field] for row in batch], format)
+            for row, text in zip(batch, texts):
+                yield dict(row, **{field: Formatted(text, row[field], format)})
@@ -0,0 +1,74 @@
+# ----------------------------------------------------------------------------#
+# Template fragment cache.
+# ----------------------------------------------------------------------------#
+# {% cache key, ttl %}...{% endcache %} renders its body once per key and
+# serves the stored markup after that. Keys carry the ids and versions
+# (updated_at) of what the fragment shows, so an edit changes the key
+# rather than needing an invalidation; stale fragments age out of the
+# size-bounded LRU. ttl is optional.
+#
+# Jinja's compiled templates also go to a filesystem bytecode cache, so new
+# workers load them without recompiling.
+#
+# Config:
+#   FRAGMENT_CACHE_MAXSIZE  fragments kept per process
+#   FRAGMENT_CACHE_TTL      default seconds a fragment is kept
+#   JINJA_BYTECODE_CACHE    bytecode cache directory ('' disables it)
+import os
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from cache import LRUCache, MISSING
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=LRUCache())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cached', args), [], [], body).set_lineno(lineno)
+
+    def _cached(self, key, ttl, caller):
+        cache = self.environment.fragment_cache
+        key = repr(key)
+        value = cache.get(key)
+        if value is MISSING:
+            value = caller()
+            cache.set(key, value, ttl)
+        return value
+
+
+class FragmentCache:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        env = app.jinja_env
+        env.add_extension(FragmentCacheExtension)
+        env.fragment_cache = LRUCache(app.config.get('FRAGMENT_CACHE_MAXSIZE', 10000),
+                                      app.config.get('FRAGMENT_CACHE_TTL', 3600))
+        directory = app.config.get('JINJA_BYTECODE_CACHE')
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            env.bytecode_cache = FileSystemBytecodeCache(directory)
+        self.env = env
+        app.extensions['fragment_cache'] = self
+
+    def clear(self):
+        self.env.fragment_cache.clear()
+
+    def stats(self):
+        return self.env.fragment_cache.stats()
@@ -0,0 +1,284 @@
+# ----------------------------------------------------------------------------#
+# Background jobs.
+# ----------------------------------------------------------------------------#
+# Handlers subscribe to named events with @jobs.hook('venue.updated', ...).
+# A view calls jobs.emit('venue.updated', venue_id=...) after its commit,
+# which queues one job per handler and returns at once; the handlers run on
+# a pool of JOBS_WORKERS threads, each job in its own app context.
+#
+# The queue is a local SQLite file in WAL mode, so queued jobs survive a
+# restart and every process on the host shares them. A failed job is retried
+# after JOBS_RETRY_DELAY seconds, doubling each time, and kept as dead after
+# JOBS_MAX_ATTEMPTS attempts. A job whose process died while running it is
+# claimed again after JOBS_LOCK_TIMEOUT seconds, so handlers run at least
+# once and must be idempotent. Payloads are JSON: pass ids, not objects.
+#
+# stats() reports the queue depth (shared) and this process's throughput; see
+# /__debug__/jobs and `flask fyyur jobs`.
+#
+# Config:
+#   JOBS_DATABASE       SQLite file holding the queue
+#   JOBS_WORKERS        worker threads per process; 0 runs jobs inline
+#   JOBS_MAX_ATTEMPTS   attempts before a job is dead
+#   JOBS_RETRY_DELAY    seconds before the first retry
+#   JOBS_LOCK_TIMEOUT   seconds before a running job counts as lost
+#   JOBS_POLL_INTERVAL  seconds an idle worker waits between checks
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from collections import deque
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    hook TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at REAL NOT NULL,
+    locked_until REAL,
+    dead INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_run_at ON jobs (dead, run_at);
+'''
+
+# Seconds of completions the per-minute throughput is taken over.
+RATE_WINDOW = 60
+
+
+class JobQueue:
+
+    def __init__(self, app=None):
+        self.handlers = {}
+        # event: [handler names]
+        self.hooks = {}
+        self.path = None
+        self.workers = 0
+        self._local = threading.local()
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._counts = {'emitted': 0, 'completed': 0, 'failed': 0, 'died': 0}
+        self._completed_at = deque()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.path = config.get('JOBS_DATABASE', os.path.join(app.root_path, '.jobs.sqlite3'))
+        self.workers = config.get('JOBS_WORKERS', 2)
+        self.max_attempts = config.get('JOBS_MAX_ATTEMPTS', 5)
+        self.retry_delay = config.get('JOBS_RETRY_DELAY', 10)
+        self.lock_timeout = config.get('JOBS_LOCK_TIMEOUT', 300)
+        self.poll_interval = config.get('JOBS_POLL_INTERVAL', 1)
+        app.extensions['jobs'] = self
+        if self.workers:
+            # After the fork, in each web worker; CLI commands only enqueue.
+            app.before_first_request(partial(self.start, app))
+
+    #  Hooks
+    #  ----------------------------------------------------------------
+
+    def hook(self, *events):
+        # Decorator subscribing a handler to events; subscribing it again is
+        # a no-op.
+        def register(handler):
+            name = f'{handler.__module__}.{handler.__qualname__}'
+            self.handlers[name] = handler
+            for event in events:
+                names = self.hooks.setdefault(event, [])
+                if name not in names:
+                    names.append(name)
+            return handler
+        return register
+
+    def emit(self, event, **payload):
+        # Queues the event's handlers; returns the number of jobs.
+        names = self.hooks.get(event, [])
+        if not names:
+            return 0
+        if not self.workers:
+            for name in names:
+                try:
+                    self.handlers[name](**payload)
+                except Exception:
+                    logger.exception('hook %s failed for %s', name, event)
+            return len(names)
+        data, now = json.dumps(payload), time.time()
+        with self._connection() as connection:
+            connection.executemany(
+                'INSERT INTO jobs (hook, payload, run_at, created_at) VALUES (?, ?, ?, ?)',
+                [(name, data, now, now) for name in names])
+        self._count('emitted', len(names))
+        self._wakeup.set()
+        return len(names)
+
+    #  Storage
+    #  ----------------------------------------------------------------
+
+    def _connection(self):
+        # One connection per thread; `with` commits or rolls back.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def _claim(self):
+        # The next ready job, locked to this process for lock_timeout.
+        connection = self._connection()
+        now = time.time()
+        with connection:
+            # Takes the write lock up front, so two workers never read the
+            # same job as free.
+            connection.execute('BEGIN IMMEDIATE')
+            job = connection.execute(
+                'SELECT id, hook, payload, attempts FROM jobs '
+                'WHERE dead = 0 AND run_at <= ? AND (locked_until IS NULL OR locked_until < ?) '
+                'ORDER BY run_at, id LIMIT 1', (now, now)).fetchone()
+            if job is None:
+                return None
+            id, hook, payload, attempts = job
+            connection.execute('UPDATE jobs SET locked_until = ?, attempts = ? WHERE id = ?',
+                               (now + self.lock_timeout, attempts + 1, id))
+        return id, hook, payload, attempts + 1
+
+    def _finish(self, id):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM jobs WHERE id = ?', (id,))
+
+    def _retry(self, id, attempts, error):
+        dead = attempts >= self.max_attempts
+        delay = self.retry_delay * 2 ** (attempts - 1)
+        with self._connection() as connection:
+            connection.execute(
+                'UPDATE jobs SET locked_until = NULL, run_at = ?, dead = ?, last_error = ? WHERE id = ?',
+                (time.time() + delay, int(dead), error, id))
+        return dead
+
+    #  Workers
+    #  ----------------------------------------------------------------
+
+    def start(self, app):
+        if self._threads:
+            return
+        self._stopping.clear()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(app,), name=f'fyyur-jobs-{n}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        # Lets running jobs finish; queued ones stay for the next start.
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _work(self, app):
+        while not self._stopping.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error:
+                logger.exception('job queue unavailable')
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self.run(app, *job)
+
+    def run(self, app, id, name, payload, attempts):
+        handler = self.handlers.get(name)
+        try:
+            if handler is None:
+                raise LookupError(f'no handler named {name}')
+            with app.app_context():
+                handler(**json.loads(payload))
+        except Exception:
+            error = traceback.format_exc()
+            dead = self._retry(id, attempts, error)
+            logger.warning('job %s (%s) failed on attempt %d%s:\n%s', id, name, attempts,
+                           ', giving up' if dead else '', error)
+            self._count('failed')
+            if dead:
+                self._count('died')
+        else:
+            self._finish(id)
+            self._count('completed')
+
+    #  Stats
+    #  ----------------------------------------------------------------
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self._counts[name] += n
+            if name == 'completed':
+                now = time.monotonic()
+                self._completed_at.append(now)
+                while self._completed_at[0] < now - RATE_WINDOW:
+                    self._completed_at.popleft()
+
+    def stats(self):
+        # Queue depth across processes, throughput of this one.
+        now = time.time()
+        ready, delayed, running, dead, oldest = self._connection().execute('''
+            SELECT
+                coalesce(sum(state = 'ready'), 0),
+                coalesce(sum(state = 'delayed'), 0),
+                coalesce(sum(state = 'running'), 0),
+                coalesce(sum(state = 'dead'), 0),
+                min(CASE WHEN state = 'ready' THEN run_at END)
+            FROM (
+                -- A job whose lock expired is lost, and claimable again.
+                SELECT run_at, CASE
+                    WHEN dead THEN 'dead'
+                    WHEN locked_until >= :now THEN 'running'
+                    WHEN run_at <= :now THEN 'ready'
+                    ELSE 'delayed'
+                END AS state
+                FROM jobs
+            )
+        ''', {'now': now}).fetchone()
+        with self._stats_lock:
+            recent = sum(1 for at in self._completed_at if at >= time.monotonic() - RATE_WINDOW)
+        counts = self.counts()
+        return {
+            'ready': ready,
+            'delayed': delayed,
+            'running': running,
+            'dead': dead,
+            'oldest_ready_seconds': round(now - oldest, 3) if oldest is not None else 0,
+            'workers': len(self._threads),
+            'completed_per_minute': recent * 60 / RATE_WINDOW,
+            **counts,
+        }
+
+    def counts(self):
+        # This process's emitted, completed, failed and died totals.
+        with self._stats_lock:
+            return dict(self._counts)
+
+    def retry_dead(self):
+        # Requeues the dead jobs with fresh attempts; returns how many.
+        with self._connection() as connection:
+            return connection.execute(
+                'UPDATE jobs SET dead = 0, attempts = 0, run_at = ?, locked_until = NULL, last_error = NULL '
+                'WHERE dead = 1',
+                (time.time(),)).rowcount
+
+
+jobs = JobQueue()
@@ -0,0 +1,594 @@
+# ----------------------------------------------------------------------------#
+# Prometheus metrics.
+# ----------------------------------------------------------------------------#
+# /metrics serves, in the Prometheus text format:
+#   fyyur_http_request_duration_seconds  histogram, by endpoint
+#   fyyur_http_responses_total           by endpoint and status
+#   fyyur_http_requests_in_flight
+#   fyyur_template_render_seconds        histogram, by template
+#   fyyur_db_pool_checkout_seconds       histogram, by pool: waiting for a
+#                                        free connection or opening one
+#                                        (QueuePool engines)
+#   fyyur_db_connect_seconds             histogram, by pool: opening a new
+#                                        database connection
+#   fyyur_db_pool_checked_out            by pool; utilization is this over
+#   fyyur_db_pool_capacity               pool_size + max_overflow; checkouts
+#                                        wait (up to pool_timeout) at capacity
+#   fyyur_cache_requests_total           by cache (pages, fragments) and
+#                                        result (hit, miss)
+#   fyyur_jobs_total                     by result (see jobs.py)
+#   fyyur_jobs_queued                    by state, read from the queue
+# Detail pages served by asgi.py's async path are not timed.
+#
+# Each process records into its own files in METRICS_DIR, one per thread: an
+# mmap of (key, float64) entries with a single writer, so a sample is a dict
+# lookup and an in-place add, without a lock. Histogram buckets are fixed up
+# front. A scrape, served by any worker, sums the files of every process:
+# counters and histograms keep the totals of processes that have exited,
+# gauges only count live ones. Give all gunicorn workers one METRICS_DIR and
+# empty it before the server starts; without one, the maps are anonymous and
+# a scrape only sees the process that serves it.
+#
+# /metrics is off unless METRICS is set, and needs no login: expose it only
+# where Prometheus scrapes it, not on the public interface.
+#
+# Config:
+#   METRICS      on/off (default off)
+#   METRICS_DIR  directory the worker processes share
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache, partial
+from itertools import count
+
+from flask import Response, current_app, g, request, request_started, request_finished, \
+    before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from models import db
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+CHECKOUT_BUCKETS = CONNECT_BUCKETS = (.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 30)
+
+# Seconds between copies of the cache and job counters into the files.
+SNAPSHOT_INTERVAL = 1
+
+
+#  Storage
+#  ----------------------------------------------------------------
+# File layout: the bytes in use (uint32, padded to 8), then entries of a key
+# length (uint32), the UTF-8 key padded to 8 bytes and a float64 value.
+
+USED = struct.Struct('I')
+LENGTH = struct.Struct('I')
+VALUE = struct.Struct('d')
+HEADER_SIZE = 8
+INITIAL_SIZE = 64 * 1024
+
+
+def entries(buffer):
+    # (key, value offset, value) of each entry in a file's contents.
+    if len(buffer) < HEADER_SIZE:
+        # Created, not yet sized.
+        return
+    used = USED.unpack_from(buffer)[0]
+    position = HEADER_SIZE
+    while position < used:
+        length = LENGTH.unpack_from(buffer, position)[0]
+        start = position + LENGTH.size
+        offset = start + length + -(LENGTH.size + length) % 8
+        yield bytes(buffer[start:start + length]).decode(), offset, VALUE.unpack_from(buffer, offset)[0]
+        position = offset + VALUE.size
+
+
+class ValueFile:
+    # One writer at a time. An entry is written before the header counts it,
+    # so readers never see half of one. path=None maps anonymous memory.
+
+    def __init__(self, path=None):
+        self._file = None
+        if path is None:
+            self._map = mmap.mmap(-1, INITIAL_SIZE)
+        else:
+            self._file = open(path, 'a+b')
+            if os.fstat(self._file.fileno()).st_size == 0:
+                self._file.truncate(INITIAL_SIZE)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+        self.used = USED.unpack_from(self._map)[0] or HEADER_SIZE
+        self.offsets = {key: offset for key, offset, value in entries(self._map)}
+
+    def add(self, key, amount):
+        offset = self.offsets.get(key) or self._append(key)
+        VALUE.pack_into(self._map, offset, VALUE.unpack_from(self._map, offset)[0] + amount)
+
+    def set(self, key, value):
+        VALUE.pack_into(self._map, self.offsets.get(key) or self._append(key), value)
+
+    def _append(self, key):
+        encoded = key.encode()
+        offset = self.used + LENGTH.size + len(encoded) + -(LENGTH.size + len(encoded)) % 8
+        if offset + VALUE.size > len(self._map):
+            size = len(self._map)
+            while offset + VALUE.size > size:
+                size *= 2
+            self._grow(size)
+        LENGTH.pack_into(self._map, self.used, len(encoded))
+        self._map[self.used + LENGTH.size:self.used + LENGTH.size + len(encoded)] = encoded
+        VALUE.pack_into(self._map, offset, 0.0)
+        self.used = offset + VALUE.size
+        USED.pack_into(self._map, 0, self.used)
+        self.offsets[key] = offset
+        return offset
+
+    def _grow(self, size):
+        if self._file is None:
+            # Copied, and the old map left to the collector, since a scrape
+            # in another thread may be reading it.
+            grown = mmap.mmap(-1, size)
+            grown[:len(self._map)] = self._map
+            self._map = grown
+        else:
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def contents(self):
+        return self._map
+
+
+class NullFile:
+    # Where samples go while metrics are off.
+
+    def add(self, key, amount):
+        pass
+
+    def set(self, key, value):
+        pass
+
+
+class Owner:
+    # Held in a thread's locals; collected when the thread ends.
+    pass
+
+
+@lru_cache(maxsize=None)
+def decode(key):
+    name, labels, part = json.loads(key)
+    return name, tuple(labels), part
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+#  Metric types
+#  ----------------------------------------------------------------
+
+def label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, help, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._child(values))
+        return child
+
+    def key(self, values, part=None):
+        return json.dumps([self.name, [str(value) for value in values], part])
+
+    def render(self, samples):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for (values, part), value in sorted(samples.items()):
+            lines.append(f'{self.name}{label_text(self.labelnames, values)} {value!r}')
+        return lines
+
+
+class Value:
+
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+
+    def inc(self, amount=1):
+        self.registry.writer().add(self.key, amount)
+
+    def dec(self, amount=1):
+        self.registry.writer().add(self.key, -amount)
+
+    def set(self, value):
+        # Only from a collector: copies a total kept elsewhere in this
+        # process. Don't mix with inc() on one value.
+        self.registry.process_file().set(self.key, value)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _child(self, values):
+        return Value(self.registry, self.key(values))
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, registry, name, help, labels=(), collect=None):
+        # collect: read at scrape time instead of the files; returns
+        # {label values: value}. For state all processes share.
+        super().__init__(registry, name, help, labels)
+        self.collect = collect
+
+    def _child(self, values):
+        return Value(self.registry, self.key(values))
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def render(self, samples):
+        if self.collect is not None:
+            samples = {(tuple(map(str, values)), None): float(value) for values, value in self.collect().items()}
+        return super().render(samples)
+
+
+class HistogramValue:
+
+    def __init__(self, registry, metric, values):
+        self.registry = registry
+        self.bounds = metric.buckets
+        # One key per bucket, +Inf last; buckets count only their own range
+        # and are summed up at scrape time.
+        self.keys = [metric.key(values, i) for i in range(len(metric.buckets) + 1)]
+        self.sum_key = metric.key(values, 'sum')
+
+    def observe(self, value):
+        writer = self.registry.writer()
+        writer.add(self.keys[bisect_left(self.bounds, value)], 1)
+        writer.add(self.sum_key, value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self, values):
+        return HistogramValue(self.registry, self, values)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def render(self, samples):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        series = defaultdict(dict)
+        for (values, part), value in samples.items():
+            series[values][part] = value
+        bounds = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+        for values, parts in sorted(series.items()):
+            total = 0.0
+            for i, bound in enumerate(bounds):
+                total += parts.get(i, 0.0)
+                lines.append(f'{self.name}_bucket{label_text(self.labelnames, values, [("le", bound)])} {total!r}')
+            labels = label_text(self.labelnames, values)
+            lines.append(f'{self.name}_sum{labels} {parts.get("sum", 0.0)!r}')
+            lines.append(f'{self.name}_count{labels} {total!r}')
+        return lines
+
+
+#  Pool
+#  ----------------------------------------------------------------
+
+class TimedQueuePool(QueuePool):
+    # QueuePool timing its checkouts into checkout_time, a histogram child
+    # set per engine. Metrics.init_app makes it the pool class of the engines
+    # configured with a QueuePool; dispose() carries checkout_time over.
+    checkout_time = None
+
+    def connect(self):
+        return self._timed(super().connect)
+
+    def unique_connection(self):
+        return self._timed(super().unique_connection)
+
+    def _timed(self, checkout):
+        if self.checkout_time is None:
+            return checkout()
+        started = time.perf_counter()
+        try:
+            return checkout()
+        finally:
+            self.checkout_time.observe(time.perf_counter() - started)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.checkout_time = self.checkout_time
+        return pool
+
+
+#  Registry
+#  ----------------------------------------------------------------
+
+class Metrics:
+
+    def __init__(self, app=None):
+        self.metrics = {}
+        # Called under the snapshot lock to set() totals kept elsewhere.
+        self.collectors = []
+        # pool name: engine
+        self.engines = {}
+        self.enabled = False
+        self.directory = None
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+        if app is not None:
+            self.init_app(app)
+
+    def _reset(self):
+        # Per process: a forked worker starts over with files of its own.
+        self._local = threading.local()
+        self._free = []
+        self._numbers = count()
+        self._process = None
+        # Without a METRICS_DIR: this process's maps.
+        self._anonymous = []
+        self._lock = threading.Lock()
+        self._snapshot_at = 0.0
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(self, name, help, labels))
+
+    def gauge(self, name, help, labels=(), collect=None):
+        return self._register(Gauge(self, name, help, labels, collect))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, help, labels, buckets))
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    #  Files
+    #  ----------------------------------------------------------------
+
+    def _file(self, name):
+        if not self.directory:
+            file = ValueFile()
+            self._anonymous.append(file)
+            return file
+        return ValueFile(os.path.join(self.directory, f'{os.getpid()}-{name}.db'))
+
+    def _contents(self):
+        # (pid, bytes) of every file.
+        if not self.directory:
+            for file in list(self._anonymous):
+                yield os.getpid(), file.contents()
+            return
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.db'):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), 'rb') as f:
+                    yield int(filename.split('-', 1)[0]), f.read()
+            except FileNotFoundError:
+                continue
+
+    def writer(self):
+        # This thread's file.
+        file = getattr(self._local, 'file', None)
+        if file is None:
+            file = self._local.file = self._checkout()
+        return file
+
+    def _checkout(self):
+        if not self.enabled:
+            return NullFile()
+        try:
+            file = self._free.pop()
+        except IndexError:
+            file = self._file(next(self._numbers))
+        # When the thread ends, the next new thread takes over its file.
+        self._local.owner = Owner()
+        weakref.finalize(self._local.owner, self._free.append, file)
+        return file
+
+    def process_file(self):
+        # Written only under the snapshot lock.
+        if self._process is None:
+            self._process = self._file('process') if self.enabled else NullFile()
+        return self._process
+
+    def snapshot(self, force=False):
+        # Runs the collectors, at most every SNAPSHOT_INTERVAL seconds unless
+        # forced.
+        if not force and time.monotonic() - self._snapshot_at < SNAPSHOT_INTERVAL:
+            return
+        with self._lock:
+            self._snapshot_at = time.monotonic()
+            for collect in self.collectors:
+                collect()
+
+    def read(self):
+        # {metric name: {(label values, part): value}}, summed over the files.
+        samples = defaultdict(lambda: defaultdict(float))
+        live = {}
+        for pid, data in self._contents():
+            if pid not in live:
+                live[pid] = alive(pid)
+            for key, offset, value in entries(data):
+                name, values, part = decode(key)
+                metric = self.metrics.get(name)
+                if metric is None or (metric.kind == 'gauge' and not live[pid]):
+                    continue
+                samples[name][values, part] += value
+        return samples
+
+    def exposition(self):
+        samples = self.read()
+        lines = []
+        for metric in self.metrics.values():
+            lines += metric.render(samples.get(metric.name, {}))
+        return '\n'.join(lines) + '\n'
+
+    def serve(self):
+        self.snapshot(force=True)
+        return Response(self.exposition(), content_type=CONTENT_TYPE)
+
+    #  Instrumentation
+    #  ----------------------------------------------------------------
+
+    def init_app(self, app):
+        app.extensions['metrics'] = self
+        self.enabled = app.config.get('METRICS', False)
+        if not self.enabled:
+            return
+        self.directory = app.config.get('METRICS_DIR')
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+        if 'pool_size' in options and 'poolclass' not in options:
+            # Before the engines, which are created on first use.
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(options, poolclass=TimedQueuePool)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        request_started.connect(self._request_started, app)
+        request_finished.connect(self._request_finished, app)
+        app.teardown_request(self._request_done)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        for bind in [None, *(app.config.get('SQLALCHEMY_BINDS') or {})]:
+            self._instrument_engine(db.get_engine(app, bind=bind), bind or 'primary')
+        self.collectors.append(partial(self._collect, app))
+        app.add_url_rule('/metrics', 'metrics', self.serve)
+
+    def _request_started(self, sender, **extra):
+        g.metrics_started = time.perf_counter()
+        self._local.renders = []
+        in_flight.inc()
+
+    def _request_finished(self, sender, response, **extra):
+        g.metrics_status = response.status_code
+
+    def _request_done(self, exc):
+        # Teardown runs even when the view raised.
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        in_flight.dec()
+        endpoint = request.endpoint or 'none'
+        request_duration.labels(endpoint).observe(time.perf_counter() - started)
+        responses.labels(endpoint, g.get('metrics_status', 500)).inc()
+        self.snapshot()
+
+    def _before_render(self, sender, template, context, **extra):
+        renders = getattr(self._local, 'renders', None)
+        if renders is None:
+            renders = self._local.renders = []
+        renders.append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        renders = getattr(self._local, 'renders', None)
+        if renders:
+            render_time.labels(template.name or 'string').observe(time.perf_counter() - renders.pop())
+
+    def _instrument_engine(self, engine, name):
+        # Pool listeners carry over to the pool dispose() replaces it with,
+        # and dialect listeners belong to the engine.
+        checked_out, connect = pool_checked_out.labels(name), connect_time.labels(name)
+        if isinstance(engine.pool, TimedQueuePool):
+            engine.pool.checkout_time = pool_checkout.labels(name)
+        event.listen(engine.pool, 'checkout', lambda *args: checked_out.inc())
+        event.listen(engine.pool, 'checkin', lambda *args: checked_out.dec())
+
+        @event.listens_for(engine, 'do_connect')
+        def timed_connect(dialect, connection_record, cargs, cparams):
+            started = time.perf_counter()
+            try:
+                return dialect.connect(*cargs, **cparams)
+            finally:
+                connect.observe(time.perf_counter() - started)
+
+        self.engines[name] = engine
+
+    def _collect(self, app):
+        caches = {'pages': getattr(app.extensions.get('cache'), 'backend', None)}
+        fragments = app.extensions.get('fragment_cache')
+        if fragments is not None:
+            caches['fragments'] = fragments.env.fragment_cache
+        for name, backend in caches.items():
+            cache_requests.labels(name, 'hit').set(getattr(backend, 'hits', 0))
+            cache_requests.labels(name, 'miss').set(getattr(backend, 'misses', 0))
+        jobs = app.extensions.get('jobs')
+        if jobs is not None:
+            for result, value in jobs.counts().items():
+                job_results.labels(result).set(value)
+        # Every bind is built with the same options; QueuePool's default
+        # max_overflow is 10.
+        overflow = (app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}).get('max_overflow', 10)
+        for name, engine in self.engines.items():
+            if hasattr(engine.pool, 'size'):
+                pool_capacity.labels(name).set(engine.pool.size() + max(overflow, 0))
+
+
+metrics = Metrics()
+
+request_duration = metrics.histogram(
+    'fyyur_http_request_duration_seconds', 'Time to respond, by endpoint.', ['endpoint'])
+responses = metrics.counter(
+    'fyyur_http_responses_total', 'Responses by endpoint and status.', ['endpoint', 'status'])
+in_flight = metrics.gauge('fyyur_http_requests_in_flight', 'Requests being handled.')
+render_time = metrics.histogram('fyyur_template_render_seconds', 'Time to render a template.', ['template'])
+pool_checkout = metrics.histogram(
+    'fyyur_db_pool_checkout_seconds', 'Time to get a connection from the pool.', ['pool'], CHECKOUT_BUCKETS)
+connect_time = metrics.histogram(
+    'fyyur_db_connect_seconds', 'Time to open a database connection.', ['pool'], CONNECT_BUCKETS)
+pool_checked_out = metrics.gauge('fyyur_db_pool_checked_out', 'Connections in use.', ['pool'])
+pool_capacity = metrics.gauge('fyyur_db_pool_capacity', 'Connections the pool may open.', ['pool'])
+cache_requests = metrics.counter(
+    'fyyur_cache_requests_total', 'Cache lookups by cache and result.', ['cache', 'result'])
+job_results = metrics.counter('fyyur_jobs_total', 'Background jobs by result.', ['result'])
+
+
+def queued_jobs():
+    jobs = current_app.extensions.get('jobs')
+    if jobs is None or jobs.path is None:
+        return {}
+    stats = jobs.stats()
+    return {(state,): stats[state] for state in ('ready', 'delayed', 'running', 'dead')}
+
+
+jobs_queued = metrics.gauge('fyyur_jobs_queued', 'Background jobs in the queue, by state.', ['state'],
+                            collect=queued_jobs)
@@ -0,0 +1,43 @@
+"""single-column Show primary key and indexes for the hot query paths
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Show was keyed on (id, artist_id, venue_id), which no venue or artist
+    # lookup could use, and id had no sequence behind it.
+    op.drop_constraint('Show_pkey', 'Show', type_='primary')
+    op.create_primary_key('Show_pkey', 'Show', ['id'])
+    op.execute('CREATE SEQUENCE IF NOT EXISTS "Show_id_seq" OWNED BY "Show".id')
+    op.execute('SELECT setval(\'"Show_id_seq"\', COALESCE(MAX(id), 0) + 1, false) FROM "Show"')
+    op.alter_column('Show', 'id', server_default=sa.text('nextval(\'"Show_id_seq"\'::regclass)'))
+
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+    op.create_index('ix_Venue_city_state', 'Venue', ['city', 'state', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_city_state', table_name='Venue')
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
+
+    op.alter_column('Show', 'id', server_default=None)
+    op.execute('DROP SEQUENCE IF EXISTS "Show_id_seq"')
+    op.drop_constraint('Show_pkey', 'Show', type_='primary')
+    op.create_primary_key('Show_pkey', 'Show', ['id', 'artist_id', 'venue_id'])
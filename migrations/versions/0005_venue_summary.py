@@ -0,0 +1,50 @@
+"""precomputed /venues summary rows
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('VenueSummary',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('city', sa.String(length=120), nullable=True),
+    sa.Column('state', sa.String(length=120), nullable=True),
+    sa.Column('num_upcoming_shows', sa.Integer(), nullable=False),
+    sa.Column('num_past_shows', sa.Integer(), nullable=False),
+    sa.Column('next_show_at', sa.DateTime(), nullable=True),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_VenueSummary_city_state', 'VenueSummary', ['city', 'state', 'id'], unique=False)
+    op.create_index('ix_VenueSummary_next_show_at', 'VenueSummary', ['next_show_at'], unique=False)
+    # Show times are naive local times, as datetime.now() gives them.
+    op.execute('''
+        INSERT INTO "VenueSummary" (id, name, city, state, num_upcoming_shows, num_past_shows,
+                                    next_show_at, refreshed_at)
+        SELECT v.id, v.name, v.city, v.state,
+               (SELECT count(*) FROM "Show" s WHERE s.venue_id = v.id AND s.start_time > LOCALTIMESTAMP),
+               (SELECT count(*) FROM "Show" s WHERE s.venue_id = v.id AND s.start_time < LOCALTIMESTAMP),
+               (SELECT min(s.start_time) FROM "Show" s WHERE s.venue_id = v.id AND s.start_time > LOCALTIMESTAMP),
+               LOCALTIMESTAMP
+        FROM "Venue" v
+    ''')
+
+
+def downgrade():
+    op.drop_index('ix_VenueSummary_next_show_at', table_name='VenueSummary')
+    op.drop_index('ix_VenueSummary_city_state', table_name='VenueSummary')
+    op.drop_table('VenueSummary')
@@ -0,0 +1,65 @@
+"""normalized genres with GIN indexes
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+# models.GENRES as of this revision.
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop',
+    'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae',
+    'Rock n Roll', 'Soul', 'Other',
+]
+
+
+def upgrade():
+    canonical = ', '.join(f"('{genre.lower()}', '{genre}')" for genre in GENRES)
+    for table in ('Venue', 'Artist'):
+        # The form handlers stored ",".join(genre), which the array type
+        # split into one element per character: {J,",",a,",",z,",",z}.
+        # updated_at moves with every fix, so API ETags and cached fragments
+        # of the rows change too.
+        op.execute(f'''
+            UPDATE "{table}"
+            SET genres = ARRAY[replace(array_to_string(genres, ''), ',', '')],
+                updated_at = now() at time zone 'utc'
+            WHERE cardinality(genres) > 1
+              AND NOT EXISTS (SELECT 1 FROM unnest(genres) AS g WHERE length(g) <> 1)
+        ''')
+        # GENRES spellings, trimmed, without blanks or duplicates, in order.
+        op.execute(f'''
+            WITH fixed AS (
+                SELECT t.id, ARRAY(
+                    SELECT coalesce(c.name, trim(g.value))
+                    FROM unnest(t.genres) WITH ORDINALITY AS g(value, n)
+                    LEFT JOIN (VALUES {canonical}) AS c(key, name) ON c.key = lower(trim(g.value))
+                    WHERE trim(g.value) <> ''
+                    GROUP BY 1
+                    ORDER BY min(g.n)
+                )::varchar[] AS genres
+                FROM "{table}" t
+                WHERE t.genres IS NOT NULL
+            )
+            UPDATE "{table}" t
+            SET genres = fixed.genres, updated_at = now() at time zone 'utc'
+            FROM fixed
+            WHERE fixed.id = t.id AND fixed.genres IS DISTINCT FROM t.genres
+        ''')
+        op.create_index(f'ix_{table}_genres', table, ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    # The data fixes stay; only the indexes are dropped.
+    op.drop_index('ix_Artist_genres', table_name='Artist')
+    op.drop_index('ix_Venue_genres', table_name='Venue')
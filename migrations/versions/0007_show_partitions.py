@@ -0,0 +1,126 @@
+"""monthly Show partitions and ShowArchive
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+# Show indexes as of this revision: name -> columns.
+INDEXES = {
+    'ix_Show_artist_id_start_time': ['artist_id', 'start_time'],
+    'ix_Show_start_time_id': ['start_time', 'id'],
+    'ix_Show_updated_at': ['updated_at'],
+    'ix_Show_venue_id_start_time': ['venue_id', 'start_time'],
+}
+COLUMNS = 'id, artist_id, venue_id, start_time, updated_at'
+# Months of partitions created past the current one.
+AHEAD = 12
+
+
+def _months(first, last):
+    month = datetime(first.year, first.month, 1)
+    while month <= last:
+        following = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+        yield month, following
+        month = following
+
+
+def upgrade():
+    op.create_table('ShowArchive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ShowArchive_venue_id_start_time', 'ShowArchive', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_ShowArchive_artist_id_start_time', 'ShowArchive', ['artist_id', 'start_time'], unique=False)
+
+    # The old table steps aside, freeing its index names, and hands its id
+    # sequence over to the partitioned one.
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_unpartitioned"')
+    op.execute('ALTER TABLE "Show_unpartitioned" DROP CONSTRAINT "Show_pkey"')
+    for name in INDEXES:
+        op.drop_index(name, table_name='Show_unpartitioned')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+    # A partitioned table's primary key must include the partition key.
+    op.execute('''
+        CREATE TABLE "Show" (
+            id INTEGER NOT NULL DEFAULT nextval('"Show_id_seq"'::regclass),
+            artist_id INTEGER NOT NULL REFERENCES "Artist" (id),
+            venue_id INTEGER NOT NULL REFERENCES "Venue" (id),
+            start_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            CONSTRAINT "Show_pkey" PRIMARY KEY (id, start_time)
+        ) PARTITION BY RANGE (start_time)
+    ''')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+
+    # One partition per month from the oldest show through AHEAD months from
+    # now; anything later lands in the default partition until
+    # `flask fyyur partition-shows` creates its month.
+    bind = op.get_bind()
+    now = bind.execute(sa.text('SELECT LOCALTIMESTAMP')).scalar()
+    oldest = bind.execute(sa.text('SELECT min(start_time) FROM "Show_unpartitioned"')).scalar()
+    last = datetime(now.year + (now.month + AHEAD - 1) // 12, (now.month + AHEAD - 1) % 12 + 1, 1)
+    for lower, upper in _months(min(oldest or now, now), last):
+        op.execute(f'''
+            CREATE TABLE "Show_p{lower:%Y%m}" PARTITION OF "Show"
+            FOR VALUES FROM ('{lower:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')
+        ''')
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+
+    op.execute(f'INSERT INTO "Show" ({COLUMNS}) SELECT {COLUMNS} FROM "Show_unpartitioned"')
+    op.execute('DROP TABLE "Show_unpartitioned"')
+    # Built after the copy; each is created on every partition.
+    for name, columns in INDEXES.items():
+        op.create_index(name, 'Show', columns, unique=False)
+
+
+def downgrade():
+    # Archived shows move back into the plain table; detached partitions
+    # are left alone.
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_partitioned"')
+    op.execute('ALTER TABLE "Show_partitioned" DROP CONSTRAINT "Show_pkey"')
+    for name in INDEXES:
+        op.drop_index(name, table_name='Show_partitioned')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+    op.create_table('Show',
+    sa.Column('id', sa.Integer(), server_default=sa.text('nextval(\'"Show_id_seq"\'::regclass)'),
+              nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.execute(f'''
+        INSERT INTO "Show" ({COLUMNS})
+        SELECT {COLUMNS} FROM "Show_partitioned"
+        UNION ALL
+        SELECT {COLUMNS} FROM "ShowArchive"
+    ''')
+    op.execute('DROP TABLE "Show_partitioned"')
+    for name, columns in INDEXES.items():
+        op.create_index(name, 'Show', columns, unique=False)
+    op.drop_index('ix_ShowArchive_artist_id_start_time', table_name='ShowArchive')
+    op.drop_index('ix_ShowArchive_venue_id_start_time', table_name='ShowArchive')
+    op.drop_table('ShowArchive')
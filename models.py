@@ -1,8 +1,35 @@
-from flask_sqlalchemy import SQLAlchemy
-db = SQLAlchemy()
+import threading
+from datetime import datetime
+from routing import RoutingSQLAlchemy, RoutingSession
+db = RoutingSQLAlchemy()
+
+# Postgres stores genres as a native array; SQLite (used for local checks)
+# has no ARRAY type, so it falls back to a JSON column.
+Genres = db.ARRAY(db.String()).with_variant(db.JSON(), 'sqlite')
+
+
+def updated_at():
+    # Row version for API ETags; indexed so MAX(updated_at) is one index probe.
+    return db.Column(db.DateTime, nullable=False, index=True,
+                     default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+def insert_rows(table, rows, batch_size=1000):
+    # Multi-row INSERTs of batch_size rows on Postgres; SQLite runs
+    # executemany. Bypasses the ORM, so no flush events fire.
+    if db.engine.dialect.name == 'postgresql':
+        for i in range(0, len(rows), batch_size):
+            db.session.execute(table.insert().values(rows[i:i + batch_size]))
+    else:
+        db.session.execute(table.insert(), rows)
+    if table.name in VERSIONED_TABLES:
+        bump_versions(db.session.connection(), [table.name])
+
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    # /venues pages through (city, state, id).
+    __table_args__ = (db.Index('ix_Venue_city_state', 'city', 'state', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String())
     city = db.Column(db.String(120))
@@ -10,11 +37,12 @@ class Venue(db.Model):
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
-    genres = db.Column(db.ARRAY(db.String()))
+    genres = db.Column(Genres)
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String())
+    updated_at = updated_at()
     shows = db.relationship('Show', backref='venue')
 
     def __repr__(self):
@@ -32,11 +60,12 @@ class Artist(db.Model):
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
-    genres = db.Column(db.ARRAY(db.String()))
+    genres = db.Column(Genres)
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String())
+    updated_at = updated_at()
     shows = db.relationship('Show', backref='artist')
 
     def __repr__(self):
@@ -44,10 +73,461 @@ class Artist(db.Model):
 
 class Show(db.Model):
   __tablename__ = 'Show'
+  # Detail pages read a venue's or artist's shows by start_time, and /shows
+  # pages through (start_time, id). On Postgres the table is partitioned by
+  # month of start_time and keyed on (id, start_time) (see "Show partitions"
+  # below); ids still come from one sequence, so id alone identifies a show.
+  __table_args__ = (
+      db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+      db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+      db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+  )
   id = db.Column(db.Integer, primary_key=True)
-  artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), primary_key=True)
-  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), primary_key=True)
+  artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
   start_time = db.Column(db.DateTime, nullable=False)
+  updated_at = updated_at()
 
   def __repr__(self):
-        return f'<Show {self.id} {self.start_time}>'
\ No newline at end of file
+        return f'<Show {self.id} {self.start_time}>'
+
+
+class ShowArchive(db.Model):
+    # Shows moved out of Show by `flask fyyur partition-shows`. Only detail
+    # pages asked for their full history read it.
+    __tablename__ = 'ShowArchive'
+    __table_args__ = (
+        db.Index('ix_ShowArchive_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_ShowArchive_artist_id_start_time', 'artist_id', 'start_time'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<ShowArchive {self.id} {self.start_time}>'
+
+
+class VenueSummary(db.Model):
+    # One precomputed /venues row per venue, kept current by summary.py.
+    # The counts hold from refreshed_at until next_show_at.
+    __tablename__ = 'VenueSummary'
+    __table_args__ = (db.Index('ix_VenueSummary_city_state', 'city', 'state', 'id'),)
+    id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+    name = db.Column(db.String())
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0)
+    num_past_shows = db.Column(db.Integer, nullable=False, default=0)
+    next_show_at = db.Column(db.DateTime, index=True)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<VenueSummary {self.id} {self.city}, {self.state}>'
+
+
+# ----------------------------------------------------------------------------#
+# Table versions.
+# ----------------------------------------------------------------------------#
+# One row per table behind the API listings, bumped in the same transaction
+# as every write to that table, so an ETag for a whole listing is a primary
+# key lookup whatever the table size. ORM writes are caught at flush;
+# insert_rows() and other Core writes call bump_versions() themselves. The
+# row stays locked until the writing transaction ends, so writes to one
+# table commit one after another.
+
+VERSIONED_TABLES = ['Venue', 'Artist', 'Show']
+
+
+class TableVersion(db.Model):
+    __tablename__ = 'TableVersion'
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<TableVersion {self.name} {self.version}>'
+
+
+def bump_versions(connection, names):
+    # Sorted, so concurrent writers lock the rows in the same order.
+    table = TableVersion.__table__
+    connection.execute(table.update().where(table.c.name.in_(sorted(set(names)))).values(
+        version=table.c.version + 1, updated_at=datetime.utcnow()))
+
+
+@db.event.listens_for(TableVersion.__table__, 'after_create')
+def _seed_versions(table, connection, **kw):
+    connection.execute(table.insert(), [{'name': name, 'version': 0, 'updated_at': datetime.utcnow()}
+                                        for name in VERSIONED_TABLES])
+
+
+@db.event.listens_for(RoutingSession, 'after_flush')
+def _bump_flushed(session, flush_context):
+    names = {obj.__table__.name for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+             if getattr(obj, '__table__', None) is not None and obj.__table__.name in VERSIONED_TABLES}
+    if names:
+        bump_versions(session.connection(), names)
+
+
+# ----------------------------------------------------------------------------#
+# Name search.
+# ----------------------------------------------------------------------------#
+# On Postgres, Venue.name and Artist.name carry pg_trgm GIN indexes, which
+# serve ILIKE '%term%' without a sequential scan, and results are ranked by
+# similarity(). Other databases fall back to an in-memory trigram index so
+# the same search can be exercised locally on SQLite.
+
+db.event.listen(
+    db.metadata, 'before_create',
+    db.DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+for _model in (Venue, Artist):
+    db.event.listen(
+        _model.__table__, 'after_create',
+        db.DDL(f'CREATE INDEX IF NOT EXISTS "ix_{_model.__tablename__}_name_trgm" '
+               'ON %(fullname)s USING gin (name gin_trgm_ops)').execute_if(dialect='postgresql'))
+
+
+def trigrams(text):
+    # pg_trgm style: lower-cased words padded with two leading blanks and one
+    # trailing blank.
+    grams = set()
+    for word in text.lower().split():
+        word = f'  {word} '
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def similarity(a, b):
+    a, b = trigrams(a), trigrams(b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class TrigramIndex:
+    # Pure-Python stand-in for the pg_trgm index: trigram -> ids posting
+    # lists over the raw lower-cased names, so every name containing the
+    # term is found by intersecting the term's trigram postings.
+
+    def __init__(self):
+        self.names = {}
+        self.postings = {}
+
+    @staticmethod
+    def _grams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, id, name):
+        self.remove(id)
+        name = (name or '').lower()
+        self.names[id] = name
+        for gram in self._grams(name):
+            self.postings.setdefault(gram, set()).add(id)
+
+    def remove(self, id):
+        name = self.names.pop(id, None)
+        if name is None:
+            return
+        for gram in self._grams(name):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(id)
+                if not ids:
+                    del self.postings[gram]
+
+    def search(self, term, limit=None, prefix=False):
+        # Returns [(id, score)], best match first.
+        term = term.lower()
+        grams = self._grams(term)
+        if grams:
+            postings = sorted((self.postings.get(g, set()) for g in grams), key=len)
+            candidates = set.intersection(*postings)
+        else:
+            candidates = self.names
+        matches = []
+        for id in candidates:
+            name = self.names[id]
+            if name.startswith(term) if prefix else term in name:
+                matches.append((id, similarity(name, term)))
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        return matches[:limit] if limit is not None else matches
+
+
+class NameSearch:
+    # Ranked, case-insensitive substring (or prefix) search over model.name.
+    # ORM writes reach the in-memory index when their session commits; the
+    # changes a flush makes wait in session.info until then, and a rollback
+    # drops them.
+
+    def __init__(self, model):
+        self.model = model
+        self._index = None
+        self._lock = threading.Lock()
+        db.event.listen(model, 'after_insert', self._changed)
+        db.event.listen(model, 'after_update', self._changed)
+        db.event.listen(model, 'after_delete', self._deleted)
+        db.event.listen(RoutingSession, 'after_commit', self._committed)
+        db.event.listen(RoutingSession, 'after_rollback', self._rolled_back)
+
+    def apply(self, query, term, limit=None, prefix=False):
+        # Filters query to the matches for term and orders it by relevance.
+        model = self.model
+        if db.engine.dialect.name == 'postgresql':
+            # The term matches literally: %, _ and \ are escaped.
+            escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            pattern = f'{escaped}%' if prefix else f'%{escaped}%'
+            query = query.filter(model.name.ilike(pattern, escape='\\')).order_by(
+                db.func.similarity(model.name, term).desc(), model.id)
+        else:
+            ranked = self.index().search(term, limit, prefix)
+            # The ids and ranks are integers from the index, written into the
+            # statement: bound, a broad term would pass SQLite's limit on
+            # parameters.
+            ids = [db.literal_column(str(int(id))) for id, score in ranked]
+            query = query.filter(model.id.in_(ids))
+            if ids:
+                query = query.order_by(db.case(
+                    [(model.id == id, db.literal_column(str(rank))) for rank, id in enumerate(ids)]))
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                index = TrigramIndex()
+                for id, name in db.session.query(self.model.id, self.model.name):
+                    index.add(id, name)
+                self._index = index
+            return self._index
+
+    def invalidate(self):
+        # Drops the in-memory index; it is rebuilt on the next search. Needed
+        # after writes that bypass the ORM (bulk inserts, raw SQL).
+        with self._lock:
+            self._index = None
+
+    def _pending(self, target):
+        # id: name, or None for a delete, of the rows flushed in target's
+        # session.
+        return db.object_session(target).info.setdefault(self, {})
+
+    def _changed(self, mapper, connection, target):
+        self._pending(target)[target.id] = target.name
+
+    def _deleted(self, mapper, connection, target):
+        self._pending(target)[target.id] = None
+
+    def _committed(self, session):
+        pending = session.info.pop(self, None)
+        if pending and self._index is not None:
+            with self._lock:
+                for id, name in pending.items():
+                    if name is None:
+                        self._index.remove(id)
+                    else:
+                        self._index.add(id, name)
+
+    def _rolled_back(self, session):
+        session.info.pop(self, None)
+
+
+venue_names = NameSearch(Venue)
+artist_names = NameSearch(Artist)
+
+
+# ----------------------------------------------------------------------------#
+# Genres.
+# ----------------------------------------------------------------------------#
+# Venue.genres and Artist.genres hold GENRES names. On Postgres the arrays
+# carry GIN indexes: a genre filter is array containment (genres @> ARRAY[..])
+# and the facet counts are one statement of per-genre containment counts,
+# all served by the index. Other databases fall back to an in-memory
+# genre -> ids index, as name search does.
+
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop',
+    'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae',
+    'Rock n Roll', 'Soul', 'Other',
+]
+_CANONICAL_GENRES = {genre.lower(): genre for genre in GENRES}
+
+# Genre selections whose facet counts are kept per table version.
+FACET_CACHE_SIZE = 256
+
+for _model in (Venue, Artist):
+    db.event.listen(
+        _model.__table__, 'after_create',
+        db.DDL(f'CREATE INDEX IF NOT EXISTS "ix_{_model.__tablename__}_genres" '
+               'ON %(fullname)s USING gin (genres)').execute_if(dialect='postgresql'))
+
+
+def normalize_genres(values):
+    # GENRES spellings, trimmed and deduplicated, in the order given; a
+    # string is taken as a comma separated list.
+    if isinstance(values, str):
+        values = values.split(',')
+    genres = []
+    for value in values or []:
+        value = (value or '').strip()
+        value = _CANONICAL_GENRES.get(value.lower(), value)
+        if value and value not in genres:
+            genres.append(value)
+    return genres
+
+
+class GenreIndex:
+    # Genre filters and facet counts over model.genres. As with NameSearch,
+    # ORM writes reach the in-memory postings when their session commits.
+    # Facet counts are kept per process until the table's TableVersion
+    # counter moves, so a listing pays for them once per write, not per hit.
+
+    def __init__(self, model):
+        self.model = model
+        self._postings = None
+        self._facets = {}
+        self._facets_version = None
+        self._lock = threading.Lock()
+        db.event.listen(model, 'after_insert', self._changed)
+        db.event.listen(model, 'after_update', self._changed)
+        db.event.listen(model, 'after_delete', self._deleted)
+        db.event.listen(RoutingSession, 'after_commit', self._committed)
+        db.event.listen(RoutingSession, 'after_rollback', self._rolled_back)
+
+    def _contains(self, genres):
+        return self.model.genres.op('@>')(db.cast(list(genres), db.ARRAY(db.String())))
+
+    def criterion(self, genres, id_column=None):
+        # Matches the rows (of model, or whose id_column is a model id) that
+        # have every one of genres.
+        if db.engine.dialect.name == 'postgresql':
+            if id_column is None:
+                return self._contains(genres)
+            return id_column.in_(db.select([self.model.id]).where(self._contains(genres)))
+        id_column = self.model.id if id_column is None else id_column
+        return id_column.in_(sorted(self.ids(genres)))
+
+    def facets(self, genres=()):
+        # [(genre, count)] for every genre in GENRES: the rows that have it on
+        # top of genres.
+        key = tuple(sorted(genres))
+        version = db.session.query(TableVersion.version) \
+            .filter(TableVersion.name == self.model.__tablename__).scalar()
+        with self._lock:
+            if version != self._facets_version:
+                self._facets, self._facets_version = {}, version
+            facets = self._facets.get(key)
+        if facets is None:
+            facets = self._count_facets(list(genres))
+            with self._lock:
+                if version == self._facets_version and len(self._facets) < FACET_CACHE_SIZE:
+                    self._facets[key] = facets
+        return facets
+
+    def _count_facets(self, genres):
+        if db.engine.dialect.name == 'postgresql':
+            counts = db.session.query(*[
+                db.select([db.func.count()]).select_from(self.model.__table__)
+                .where(self._contains(genres + [genre])).as_scalar()
+                for genre in GENRES
+            ]).one()
+            return list(zip(GENRES, counts))
+        matching = self.ids(genres)
+        postings = self.postings()
+        return [(genre, len(matching & postings.get(genre, set()))) for genre in GENRES]
+
+    def ids(self, genres):
+        postings = self.postings()
+        if not genres:
+            return set(self._all)
+        return set.intersection(*[postings.get(genre, set()) for genre in genres])
+
+    def postings(self):
+        with self._lock:
+            if self._postings is None:
+                self._postings, self._all = {}, set()
+                for id, genres in db.session.query(self.model.id, self.model.genres):
+                    self._add(id, genres)
+            return self._postings
+
+    def invalidate(self):
+        # Needed after writes that bypass the ORM, as for NameSearch.
+        with self._lock:
+            self._postings = None
+
+    def _add(self, id, genres):
+        self._all.add(id)
+        for genre in genres or []:
+            self._postings.setdefault(genre, set()).add(id)
+
+    def _remove(self, id):
+        self._all.discard(id)
+        for ids in self._postings.values():
+            ids.discard(id)
+
+    def _pending(self, target):
+        # id: genres, or None for a delete, of the rows flushed in target's
+        # session.
+        return db.object_session(target).info.setdefault(self, {})
+
+    def _changed(self, mapper, connection, target):
+        self._pending(target)[target.id] = list(target.genres or [])
+
+    def _deleted(self, mapper, connection, target):
+        self._pending(target)[target.id] = None
+
+    def _committed(self, session):
+        pending = session.info.pop(self, None)
+        if pending and self._postings is not None:
+            with self._lock:
+                for id, genres in pending.items():
+                    self._remove(id)
+                    if genres is not None:
+                        self._add(id, genres)
+
+    def _rolled_back(self, session):
+        session.info.pop(self, None)
+
+
+venue_genres = GenreIndex(Venue)
+artist_genres = GenreIndex(Artist)
+
+
+# ----------------------------------------------------------------------------#
+# Show partitions.
+# ----------------------------------------------------------------------------#
+# On Postgres (11 or later) "Show" is range-partitioned on start_time, one
+# partition per month, so reads bounded on start_time only scan the months
+# they cover. create_all() makes the plain table first; this swaps it for the
+# partitioned one, with a DEFAULT partition for the months that have none
+# yet. partitions.py creates and retires the monthly partitions.
+
+SHOW_PARTITIONED_DDL = [
+    # The table is new and empty; keep its id sequence, drop the rest.
+    'ALTER SEQUENCE "Show_id_seq" OWNED BY NONE',
+    'DROP TABLE "Show"',
+    """CREATE TABLE "Show" (
+        id INTEGER NOT NULL DEFAULT nextval('"Show_id_seq"'::regclass),
+        artist_id INTEGER NOT NULL REFERENCES "Artist" (id),
+        venue_id INTEGER NOT NULL REFERENCES "Venue" (id),
+        start_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        CONSTRAINT "Show_pkey" PRIMARY KEY (id, start_time)
+    ) PARTITION BY RANGE (start_time)""",
+    'ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id',
+    'CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT',
+] + [
+    f'CREATE INDEX "{index.name}" ON "Show" '
+    f'({", ".join(column.name for column in index.columns)})'
+    for index in sorted(Show.__table__.indexes, key=lambda index: index.name)
+]
+for _statement in SHOW_PARTITIONED_DDL:
+    db.event.listen(Show.__table__, 'after_create', db.DDL(_statement).execute_if(dialect='postgresql'))
+
+
+# Resolve the Show.venue / Show.artist backrefs now so query code can join
+# through them before the first query has configured the mappers.
+db.configure_mappers()
@@ -0,0 +1,146 @@
+# ----------------------------------------------------------------------------#
+# Show partitions and archive.
+# ----------------------------------------------------------------------------#
+# On Postgres, Show has one partition per month of start_time (Show_pYYYYMM)
+# plus Show_default for months without one (see models.py). `flask fyyur
+# partition-shows`, run from cron, keeps partitions SHOW_PARTITIONS_AHEAD
+# months past the current one and retires the months that ended more than
+# SHOW_ARCHIVE_MONTHS ago: their rows move to ShowArchive, or with --detach
+# the partitions are detached and left as standalone tables, to be dumped
+# and dropped out of band. Elsewhere Show is one plain table, and retiring
+# moves its old rows to ShowArchive.
+#
+# Detail pages list past shows from SHOW_HISTORY_MONTHS back, a bound on
+# start_time that keeps their reads on the recent partitions; ?history=all
+# lists every show, ShowArchive included. Archived shows no longer count
+# towards the /venues and search past show counts.
+#
+# Config:
+#   SHOW_HISTORY_MONTHS    months of past shows detail pages list
+#   SHOW_PARTITIONS_AHEAD  months of partitions kept past the current one
+#   SHOW_ARCHIVE_MONTHS    months after which shows are archived
+import re
+from datetime import datetime
+
+from flask import current_app, request
+
+from models import db, Show, ShowArchive, bump_versions
+from summary import refresh_venues
+
+DEFAULT_PARTITION = 'Show_default'
+COLUMNS = ['id', 'artist_id', 'venue_id', 'start_time', 'updated_at']
+PARTITION_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'Show_p{month:%Y%m}'
+
+
+#  History window
+#  ----------------------------------------------------------------
+
+def history_since(now, months):
+    # The first day of the month `months` before now's. Whole months, so the
+    # bound (and the partitions it selects) only moves once a month.
+    return add_months(month_start(now), -months)
+
+
+def history_window(now):
+    # Where a detail page's past shows start, or None for ?history=all.
+    if request.args.get('history') == 'all':
+        return None
+    return history_since(now, current_app.config.get('SHOW_HISTORY_MONTHS', 12))
+
+
+#  Maintenance
+#  ----------------------------------------------------------------
+
+def is_partitioned(connection):
+    return connection.dialect.name == 'postgresql' and connection.execute(db.text(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = '\"Show\"'::regclass")).scalar()
+
+
+def show_partitions(connection):
+    # [(name, lower, upper)] of the monthly partitions, oldest first.
+    rows = connection.execute(db.text('''
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = '"Show"'::regclass
+    '''))
+    partitions = []
+    for name, bound in rows:
+        match = PARTITION_BOUND.search(bound)
+        if match:
+            lower, upper = (datetime.fromisoformat(value) for value in match.groups())
+            partitions.append((name, lower, upper))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partitions(connection, first, last):
+    # Creates the missing partitions for the months from first through last;
+    # returns their names. Shows the default partition took for such a month
+    # move into the new partition before it is attached.
+    existing = {lower for name, lower, upper in show_partitions(connection)}
+    columns = ', '.join(COLUMNS)
+    created = []
+    month = month_start(first)
+    while month <= last:
+        lower, month = month, add_months(month, 1)
+        if lower in existing:
+            continue
+        name = partition_name(lower)
+        connection.execute(f'CREATE TABLE "{name}" (LIKE "Show" INCLUDING DEFAULTS)')
+        connection.execute(db.text(f'''
+            WITH moved AS (
+                DELETE FROM "{DEFAULT_PARTITION}"
+                WHERE start_time >= :lower AND start_time < :upper
+                RETURNING {columns}
+            )
+            INSERT INTO "{name}" ({columns}) SELECT {columns} FROM moved
+        '''), lower=lower, upper=month)
+        connection.execute(f'''ALTER TABLE "Show" ATTACH PARTITION "{name}"
+                               FOR VALUES FROM ('{lower:%Y-%m-%d}') TO ('{month:%Y-%m-%d}')''')
+        created.append(name)
+    return created
+
+
+def archive_shows(connection, before, detach=False):
+    # Retires the shows that started before `before`; returns (shows moved to
+    # ShowArchive, partitions detached). Whole partitions go at once: their
+    # rows are copied and the partition dropped, or with detach=True it is
+    # only detached. Older rows left elsewhere (the default partition, or an
+    # unpartitioned Show) are moved row by row.
+    moved, detached = 0, []
+    archive = ShowArchive.__table__
+    if is_partitioned(connection):
+        columns = ', '.join(COLUMNS)
+        for name, lower, upper in show_partitions(connection):
+            if upper > before:
+                continue
+            if detach:
+                connection.execute(f'ALTER TABLE "Show" DETACH PARTITION "{name}"')
+                detached.append(name)
+            else:
+                moved += connection.execute(
+                    f'INSERT INTO "{archive.name}" ({columns}) SELECT {columns} FROM "{name}"').rowcount
+                connection.execute(f'DROP TABLE "{name}"')
+    elif detach:
+        raise ValueError('Show is not partitioned; only Postgres partitions can be detached')
+    old = Show.start_time < before
+    moved += connection.execute(archive.insert().from_select(
+        COLUMNS, db.select([Show.__table__.c[column] for column in COLUMNS]).where(old))).rowcount
+    connection.execute(Show.__table__.delete().where(old))
+    if moved or detached:
+        # The past show counts just dropped.
+        refresh_venues(connection)
+        bump_versions(connection, ['Show'])
+    return moved, detached
@@ -0,0 +1,191 @@
+# ----------------------------------------------------------------------------#
+# Request-level SQL profiling.
+# ----------------------------------------------------------------------------#
+# Hooks SQLAlchemy's cursor events and Flask's request/template signals to
+# record, per request: query count, total DB time, template render time and
+# the slowest statements. Statements repeated SQL_PROFILING_N_PLUS_ONE times
+# or more in one request are flagged as N+1 suspects. Each request is logged
+# as one JSON line on the `fyyur.sql` logger, and per-endpoint totals are
+# served at /__debug__/queries in debug mode.
+#
+# Config:
+#   SQL_PROFILING              on/off (defaults to DEBUG)
+#   SQL_PROFILING_N_PLUS_ONE   repeats of one statement that flag a request
+#   SQL_PROFILING_SLOWEST      slowest statements kept per endpoint
+import heapq
+import json
+import logging
+import threading
+import time
+from collections import Counter
+
+from flask import abort, current_app, g, has_request_context, jsonify, request, \
+    request_started, request_finished, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('fyyur.sql')
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = []
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_started = None
+
+    def suspects(self, threshold):
+        counts = Counter(statement for statement, duration in self.statements)
+        return {statement: n for statement, n in counts.items() if n >= threshold}
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.total_time = 0.0
+        self.slowest = []
+        self.n_plus_one = {}
+
+    def add(self, profile, total_time, suspects, keep):
+        self.requests += 1
+        self.queries += len(profile.statements)
+        self.max_queries = max(self.max_queries, len(profile.statements))
+        self.db_time += profile.db_time
+        self.render_time += profile.render_time
+        self.total_time += total_time
+        for statement, duration in profile.statements:
+            entry = (duration, statement)
+            if len(self.slowest) < keep:
+                heapq.heappush(self.slowest, entry)
+            elif entry > self.slowest[0]:
+                heapq.heapreplace(self.slowest, entry)
+        self.n_plus_one.update(suspects)
+
+    def as_dict(self):
+        requests = max(self.requests, 1)
+        return {
+            "requests": self.requests,
+            "queries_per_request": self.queries / requests,
+            "max_queries": self.max_queries,
+            "db_ms_per_request": self.db_time * 1000 / requests,
+            "render_ms_per_request": self.render_time * 1000 / requests,
+            "total_ms_per_request": self.total_time * 1000 / requests,
+            "slowest": [{"ms": duration * 1000, "statement": statement}
+                        for duration, statement in sorted(self.slowest, reverse=True)],
+            "n_plus_one": self.n_plus_one,
+        }
+
+
+class SQLProfiler:
+
+    def __init__(self, app=None):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SQL_PROFILING', app.debug)
+        self.threshold = app.config.get('SQL_PROFILING_N_PLUS_ONE', 5)
+        self.keep = app.config.get('SQL_PROFILING_SLOWEST', 5)
+        app.extensions['sql_profiler'] = self
+        if not self.enabled:
+            return
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+        event.listen(Engine, 'handle_error', self._failed)
+        request_started.connect(self._request_started, app)
+        request_finished.connect(self._request_finished, app)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.add_url_rule('/__debug__/queries', 'sql_profile', self.report)
+
+    # Engine events; profiles only exist inside a request.
+
+    @staticmethod
+    def _profile():
+        if has_request_context():
+            return g.get('sql_profile')
+        return None
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append((context, time.perf_counter()))
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._finished(conn, statement)
+
+    def _failed(self, exception_context):
+        # A statement that raised never reaches after_cursor_execute; its
+        # start time must not be left for the next one on the connection.
+        conn, context = exception_context.connection, exception_context.execution_context
+        started = conn.info.get('query_started') if conn is not None else None
+        if context is not None and started and started[-1][0] is context:
+            self._finished(conn, exception_context.statement)
+
+    def _finished(self, conn, statement):
+        _, started = conn.info['query_started'].pop()
+        duration = time.perf_counter() - started
+        profile = self._profile()
+        if profile is not None:
+            profile.statements.append((statement, duration))
+            profile.db_time += duration
+
+    # Flask signals.
+
+    def _request_started(self, sender, **extra):
+        g.sql_profile = RequestProfile()
+
+    def _before_render(self, sender, template, context, **extra):
+        profile = self._profile()
+        if profile is not None:
+            profile.render_started = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        profile = self._profile()
+        if profile is not None and profile.render_started is not None:
+            profile.render_time += time.perf_counter() - profile.render_started
+            profile.render_started = None
+
+    def _request_finished(self, sender, response, **extra):
+        profile = self._profile()
+        if profile is None or request.endpoint == 'sql_profile':
+            return
+        total_time = time.perf_counter() - profile.started
+        suspects = profile.suspects(self.threshold)
+        endpoint = request.endpoint or request.path
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, EndpointStats())
+            stats.add(profile, total_time, suspects, self.keep)
+        record = {
+            "endpoint": endpoint,
+            "method": request.method,
+            "status": response.status_code,
+            "queries": len(profile.statements),
+            "db_ms": round(profile.db_time * 1000, 3),
+            "render_ms": round(profile.render_time * 1000, 3),
+            "total_ms": round(total_time * 1000, 3),
+            "n_plus_one": suspects,
+        }
+        logger.log(logging.WARNING if suspects else logging.INFO, json.dumps(record))
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: stats.as_dict() for endpoint, stats in self.endpoints.items()}
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+
+    def report(self):
+        if not current_app.debug:
+            abort(404)
+        if request.args.get('reset'):
+            self.reset()
+        return jsonify(self.snapshot())
@@ -0,0 +1,327 @@
+# ----------------------------------------------------------------------------#
+# Read-side queries shared by the views.
+# ----------------------------------------------------------------------------#
+import base64
+import json
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import GenericFunction
+
+from models import db, Venue, Artist, Show, ShowArchive, VenueSummary, venue_names, artist_names, venue_genres, artist_genres
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+#  Keyset pagination
+#  ----------------------------------------------------------------
+# Listings are paged on the ORDER BY columns of the last row seen instead of
+# OFFSET, so every page is an index range scan no matter how deep it is.
+# Cursors are opaque url-safe strings carrying those column values.
+
+def encode_cursor(values):
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError(f'invalid cursor {cursor!r}')
+    if not isinstance(values, list):
+        raise ValueError(f'invalid cursor {cursor!r}')
+    return values
+
+
+def keyset_page(query, key, after=None, limit=PAGE_SIZE):
+    # Returns (rows, next_cursor); next_cursor is None on the last page.
+    if after:
+        values = decode_cursor(after)
+        if len(values) != len(key):
+            raise ValueError(f'invalid cursor {after!r}')
+        try:
+            values = [datetime.fromisoformat(v) if isinstance(c.type, db.DateTime) else v
+                      for c, v in zip(key, values)]
+        except (TypeError, ValueError):
+            raise ValueError(f'invalid cursor {after!r}')
+        query = query.filter(db.tuple_(*key) > db.tuple_(*values))
+    rows = query.order_by(*key).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], c.key) for c in key])
+    return rows, next_cursor
+
+
+def iter_keyset(page, after=None, limit=PAGE_SIZE):
+    # Walks a listing page by page, so only one page is held at a time.
+    while True:
+        rows, after = page(after=after, limit=limit)
+        yield from rows
+        if after is None:
+            return
+
+
+#  Row versions
+#  ----------------------------------------------------------------
+# Listing rows carry a `version`: the newest updated_at among the rows they
+# are built from. Templates key their cached fragments on it.
+
+class greatest(GenericFunction):
+    type = db.DateTime()
+
+
+@compiles(greatest, 'sqlite')
+def _greatest_sqlite(element, compiler, **kw):
+    # SQLite's multi-argument max() is the scalar GREATEST.
+    return f'max({compiler.process(element.clauses, **kw)})'
+
+
+#  Show counts
+#  ----------------------------------------------------------------
+# Upcoming and past show counts are correlated subqueries in the same
+# statement as the venue or artist rows, so listings and searches never
+# issue a query per row. Each count is a range scan on the
+# (venue_id, start_time) / (artist_id, start_time) index, and the outer
+# query needs no GROUP BY, so a page's LIMIT applies before any counting.
+
+def show_count(owner_id, show_owner_id, condition):
+    return db.select([db.func.count(Show.id)]).where(
+        db.and_(show_owner_id == owner_id, condition)).as_scalar()
+
+
+def with_show_counts(query, owner_id, show_owner_id, now=None):
+    now = now or datetime.now()
+    return query.add_columns(
+        show_count(owner_id, show_owner_id, Show.start_time > now).label('num_upcoming_shows'),
+        show_count(owner_id, show_owner_id, Show.start_time < now).label('num_past_shows'),
+    )
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+def detail_shows(since=None):
+    # (shows, condition) for a detail page's show list: Show from `since` on,
+    # which on Postgres only reads the partitions of those months, or with no
+    # since the full history, ShowArchive included.
+    if since is not None:
+        return Show.__table__, Show.start_time >= since
+    columns = ['artist_id', 'venue_id', 'start_time']
+    shows = db.union_all(
+        db.select([Show.__table__.c[column] for column in columns]),
+        db.select([ShowArchive.__table__.c[column] for column in columns]),
+    ).alias('shows')
+    return shows, db.true()
+
+
+def as_dict(row):
+    # Query rows have _asdict() (as do all rows on SQLAlchemy 1.4); 1.3 Core
+    # rows only have items().
+    return row._asdict() if hasattr(row, '_asdict') else dict(row.items())
+
+
+def split_shows(rows):
+    # Rows carry an `upcoming` flag; returns (past_shows, upcoming_shows) as
+    # plain dicts so detail payloads can be cached.
+    past_shows, upcoming_shows = [], []
+    for row in rows:
+        show = as_dict(row)
+        (upcoming_shows if show.pop('upcoming') else past_shows).append(show)
+    return past_shows, upcoming_shows
+
+
+def show_page(after=None, limit=PAGE_SIZE):
+    # The venue and artist columns come in through the Show.venue /
+    # Show.artist backrefs in the same statement, and the rows are plain
+    # tuples so no ORM objects are built per show.
+    query = (
+        db.session.query(
+            Show.id,
+            Show.venue_id,
+            Venue.name.label('venue_name'),
+            Show.artist_id,
+            Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link'),
+            Show.start_time,
+            greatest(Show.updated_at, Venue.updated_at, Artist.updated_at).label('version'),
+        )
+        .join(Show.venue)
+        .join(Show.artist)
+    )
+    return keyset_page(query, (Show.start_time, Show.id), after, limit)
+
+
+#  Artists
+#  ----------------------------------------------------------------
+
+def artist_search(search_term, limit=None, prefix=False, now=None):
+    # Matches ranked by relevance; see models.NameSearch.
+    query = db.session.query(Artist.id, Artist.name)
+    query = with_show_counts(query, Artist.id, Show.artist_id, now)
+    return artist_names.apply(query, search_term, limit, prefix).all()
+
+
+def artist_detail_statements(artist_id, now, since=None):
+    # The artist row, then its shows joined with the venue columns, with the
+    # past/upcoming split computed by the database against a single "now".
+    # Only shows from `since` on; see detail_shows().
+    # Core statements, so the async path (asgi.py) runs the same ones.
+    artist = db.select([Artist.__table__]).where(Artist.id == artist_id)
+    source, window = detail_shows(since)
+    shows = (
+        db.select([
+            source.c.venue_id,
+            Venue.name.label('venue_name'),
+            Venue.image_link.label('venue_image_link'),
+            source.c.start_time,
+            (source.c.start_time > now).label('upcoming'),
+        ])
+        .select_from(source.join(Venue.__table__, source.c.venue_id == Venue.id))
+        .where(db.and_(source.c.artist_id == artist_id, source.c.start_time != now, window))
+        .order_by(source.c.start_time)
+    )
+    return artist, shows
+
+
+def artist_payload(specific_artist, rows, since=None):
+    past_shows, upcoming_shows = split_shows(rows)
+    data = {
+        "id": specific_artist.id,
+        "name": specific_artist.name,
+        "genres": specific_artist.genres,
+        "city": specific_artist.city,
+        "state": specific_artist.state,
+        "phone": specific_artist.phone,
+        "website": specific_artist.website_link,
+        "facebook_link": specific_artist.facebook_link,
+        "seeking_venue": specific_artist.seeking_venue,
+        "seeking_description": specific_artist.seeking_description,
+        "image_link": specific_artist.image_link,
+        "past_shows": past_shows,
+        "upcoming_shows": upcoming_shows,
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows),
+        # None when past_shows is the full history.
+        "history_since": since,
+    }
+    return data
+
+
+def artist_detail(artist_id, now=None, since=None):
+    now = now or datetime.now()
+    artist, shows = artist_detail_statements(artist_id, now, since)
+    specific_artist = db.session.execute(artist).first()
+    if specific_artist is None:
+        return None
+    return artist_payload(specific_artist, db.session.execute(shows), since)
+
+
+def artist_page(after=None, limit=PAGE_SIZE, genres=()):
+    # genres: only artists with all of them (see models.GenreIndex).
+    query = db.session.query(Artist.id, Artist.name, Artist.updated_at.label('version'))
+    if genres:
+        query = query.filter(artist_genres.criterion(genres))
+    return keyset_page(query, (Artist.id,), after, limit)
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+def venue_search(search_term, limit=None, prefix=False, now=None):
+    # Matches ranked by relevance; see models.NameSearch.
+    query = db.session.query(Venue.id, Venue.name)
+    query = with_show_counts(query, Venue.id, Show.venue_id, now)
+    return venue_names.apply(query, search_term, limit, prefix).all()
+
+
+def venue_page(after=None, limit=PAGE_SIZE, now=None, genres=()):
+    # Reads the precomputed VenueSummary rows (see summary.py). A row whose
+    # next show has started since it was written has stale counts, so those
+    # rows alone are counted live, in the same statement. genres: only
+    # venues with all of them.
+    now = now or datetime.now()
+    stale = db.or_(VenueSummary.next_show_at <= now, VenueSummary.refreshed_at > now)
+
+    def count(stored, condition):
+        return db.case([(stale, show_count(VenueSummary.id, Show.venue_id, condition))], else_=stored)
+
+    query = db.session.query(
+        VenueSummary.id,
+        VenueSummary.name,
+        VenueSummary.city,
+        VenueSummary.state,
+        count(VenueSummary.num_upcoming_shows, Show.start_time > now).label('num_upcoming_shows'),
+        count(VenueSummary.num_past_shows, Show.start_time < now).label('num_past_shows'),
+        # Rewritten whenever the venue changes.
+        VenueSummary.refreshed_at.label('version'),
+    )
+    if genres:
+        query = query.filter(venue_genres.criterion(genres, VenueSummary.id))
+    return keyset_page(query, (VenueSummary.city, VenueSummary.state, VenueSummary.id), after, limit)
+
+
+def venue_detail_statements(venue_id, now, since=None):
+    # The venue row, then its shows joined with the artist columns, with the
+    # past/upcoming split computed by the database against a single "now".
+    # Only shows from `since` on; see detail_shows().
+    # Core statements, so the async path (asgi.py) runs the same ones.
+    venue = db.select([Venue.__table__]).where(Venue.id == venue_id)
+    source, window = detail_shows(since)
+    shows = (
+        db.select([
+            source.c.artist_id,
+            Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link'),
+            source.c.start_time,
+            (source.c.start_time > now).label('upcoming'),
+        ])
+        .select_from(source.join(Artist.__table__, source.c.artist_id == Artist.id))
+        .where(db.and_(source.c.venue_id == venue_id, source.c.start_time != now, window))
+        .order_by(source.c.start_time)
+    )
+    return venue, shows
+
+
+def venue_payload(specific_venue, rows, since=None):
+    past_shows, upcoming_shows = split_shows(rows)
+    data = {
+        "id": specific_venue.id,
+        "name": specific_venue.name,
+        "genres": specific_venue.genres,
+        "address": specific_venue.address,
+        "city": specific_venue.city,
+        "state": specific_venue.state,
+        "phone": specific_venue.phone,
+        "website": specific_venue.website_link,
+        "facebook_link": specific_venue.facebook_link,
+        "seeking_talent": specific_venue.seeking_talent,
+        "seeking_description": specific_venue.seeking_description,
+        "image_link": specific_venue.image_link,
+        "past_shows": past_shows,
+        "upcoming_shows": upcoming_shows,
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows),
+        # None when past_shows is the full history.
+        "history_since": since,
+    }
+    return data
+
+
+def venue_detail(venue_id, now=None, since=None):
+    now = now or datetime.now()
+    venue, shows = venue_detail_statements(venue_id, now, since)
+    specific_venue = db.session.execute(venue).first()
+    if specific_venue is None:
+        return None
+    return venue_payload(specific_venue, db.session.execute(shows), since)
+
+
+def group_areas(rows):
+    # Rows arrive ordered by city/state, so areas can be grouped lazily; the
+    # inner venue iterators are consumed in order by pages/venues.html.
+    for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+        yield {"city": city, "state": state, "venues": venues}
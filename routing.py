@@ -0,0 +1,144 @@
+# ----------------------------------------------------------------------------#
+# Read-replica routing.
+# ----------------------------------------------------------------------------#
+# Replicas are configured as SQLALCHEMY_BINDS named replica_<n>. Read-only
+# requests read from one replica, picked round-robin among the healthy ones
+# and pinned for the whole request; everything else, and any flush, goes to
+# the primary. A view is read-only when marked with @read_only (the search
+# forms, which POST) or, unmarked, when the request is a GET or HEAD. After
+# a client writes, a short-lived cookie keeps its reads on the primary for
+# REPLICA_READ_YOUR_WRITES seconds so it never sees replica lag on its own
+# changes.
+#
+# Each worker checks its replicas from a background thread every
+# REPLICA_HEALTH_INTERVAL seconds; requests only read the last result.
+import itertools
+import threading
+import time
+from functools import partial
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+
+PRIMARY_COOKIE = 'fyyur_primary'
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def read_only(view):
+    # Marks a view that never writes, whatever its methods, as one replicas
+    # may serve.
+    view.read_only = True
+    return view
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        router = self.app.extensions.get('replicas')
+        if router is not None and not self._flushing:
+            engine = router.engine_for_request(self.app)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _remember_write(session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaRouter:
+    # Config:
+    #   SQLALCHEMY_BINDS           replica_<n> entries are read replicas
+    #   REPLICA_READ_YOUR_WRITES   seconds a writer's reads stay on the primary
+    #   REPLICA_HEALTH_INTERVAL    seconds between health checks of a replica
+
+    def __init__(self, app=None):
+        self.names = []
+        self._counter = itertools.count()
+        self._health = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        binds = app.config.get('SQLALCHEMY_BINDS') or {}
+        self.names = sorted(name for name in binds if name.startswith('replica_'))
+        self.window = app.config.get('REPLICA_READ_YOUR_WRITES', 5)
+        self.interval = app.config.get('REPLICA_HEALTH_INTERVAL', 5)
+        app.extensions['replicas'] = self
+        app.after_request(self._after_request)
+        if self.names:
+            # After the fork, in each web worker.
+            app.before_first_request(partial(self.start, app))
+
+    def engine_for_request(self, app):
+        # The replica engine for the current request, or None for the primary.
+        if not self.names or not has_request_context():
+            return None
+        if 'db_replica' not in g:
+            g.db_replica = None
+            if self._read_only() and not request.cookies.get(PRIMARY_COOKIE):
+                g.db_replica = self._pick()
+        if g.db_replica is None or g.get('db_wrote'):
+            return None
+        return app.extensions['sqlalchemy'].db.get_engine(app, bind=g.db_replica)
+
+    @staticmethod
+    def _read_only():
+        view = current_app.view_functions.get(request.endpoint)
+        return getattr(view, 'read_only', request.method in SAFE_METHODS)
+
+    def _pick(self):
+        with self._lock:
+            start = next(self._counter) % len(self.names)
+        for name in self.names[start:] + self.names[:start]:
+            # A replica not checked yet counts as healthy.
+            if self._health.get(name, (True, 0.0))[0]:
+                return name
+        return None
+
+    #  Health checks
+    #  ----------------------------------------------------------------
+
+    def start(self, app):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._watch, args=(app,), name='fyyur-replicas', daemon=True)
+        self._thread.start()
+
+    def _watch(self, app):
+        while True:
+            self.check(app)
+            time.sleep(self.interval)
+
+    def check(self, app):
+        # Runs one SELECT 1 on every replica and records the results.
+        for name in self.names:
+            engine = app.extensions['sqlalchemy'].db.get_engine(app, bind=name)
+            try:
+                with engine.connect() as connection:
+                    connection.execute('SELECT 1')
+                healthy = True
+            except Exception:
+                app.logger.warning('read replica %s failed its health check', name)
+                healthy = False
+            self._health[name] = (healthy, time.monotonic())
+
+    def _after_request(self, response):
+        if g.get('db_wrote'):
+            response.set_cookie(PRIMARY_COOKIE, '1', max_age=self.window, httponly=True)
+        return response
+
+    def status(self):
+        return {name: {"healthy": healthy, "checked_at": checked_at}
+                for name, (healthy, checked_at) in self._health.items()}
@@ -0,0 +1,73 @@
+# ----------------------------------------------------------------------------#
+# /venues summary table.
+# ----------------------------------------------------------------------------#
+# VenueSummary holds each venue's listing row (name, city, state and show
+# counts), so /venues is one index range read on (city, state, id). Every
+# flush that creates, edits or deletes a venue or show recomputes the rows of
+# the venues it touched, in the same transaction. Counts go stale when a
+# venue's next show starts; readers count those rows live (see
+# queries.venue_page), and `flask fyyur refresh-venues` rewrites them.
+from datetime import datetime
+
+from sqlalchemy import event
+
+from models import db, Venue, Show, VenueSummary
+from queries import show_count
+from routing import RoutingSession
+
+
+def refresh_venues(connection, venue_ids=None, now=None):
+    # Recomputes the summary rows of venue_ids (every venue if None); rows of
+    # venues that no longer exist are dropped.
+    now = now or datetime.now()
+    table = VenueSummary.__table__
+    rows = db.select([
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        show_count(Venue.id, Show.venue_id, Show.start_time > now),
+        show_count(Venue.id, Show.venue_id, Show.start_time < now),
+        db.select([db.func.min(Show.start_time)])
+        .where(db.and_(Show.venue_id == Venue.id, Show.start_time > now)).as_scalar(),
+        db.literal(now, db.DateTime),
+    ])
+    delete = table.delete()
+    if venue_ids is not None:
+        venue_ids = list(venue_ids)
+        if not venue_ids:
+            return
+        rows = rows.where(Venue.id.in_(venue_ids))
+        delete = delete.where(table.c.id.in_(venue_ids))
+    connection.execute(delete)
+    connection.execute(table.insert().from_select(
+        ['id', 'name', 'city', 'state', 'num_upcoming_shows', 'num_past_shows',
+         'next_show_at', 'refreshed_at'], rows))
+
+
+def stale_venues(connection, now=None):
+    now = now or datetime.now()
+    table = VenueSummary.__table__
+    return [id for id, in connection.execute(
+        db.select([table.c.id]).where(table.c.next_show_at <= now))]
+
+
+def _touched_venues(session):
+    venue_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Venue):
+            venue_ids.add(obj.id)
+        elif isinstance(obj, Show):
+            # A show moved to another venue changes both.
+            history = db.inspect(obj).attrs.venue_id.history
+            venue_ids.update(history.added or [obj.venue_id])
+            venue_ids.update(history.deleted or [])
+    venue_ids.discard(None)
+    return venue_ids
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _refresh_touched(session, flush_context):
+    venue_ids = _touched_venues(session)
+    if venue_ids:
+        refresh_venues(session.connection(), venue_ids)
@@ -0,0 +1,27 @@
+# ----------------------------------------------------------------------------#
+# Test setup.
+# ----------------------------------------------------------------------------#
+# The tests run against a scratch SQLite database, created fresh for the
+# session. config.py reads the environment at import, so it is set here,
+# before any test module imports the app.
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Exercise the database path, not the page cache or the profiler.
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ['CACHE_TYPE'] = 'null'
+os.environ['SQL_PROFILING'] = '0'
+os.environ['JOBS_WORKERS'] = '0'
+os.environ.setdefault('AVAILABILITY_SYNC_INTERVAL', '3600')
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def app():
+    from wsgi import app
+    return app
@@ -0,0 +1,43 @@
+# ----------------------------------------------------------------------------#
+# flask fyyur export / import.
+# ----------------------------------------------------------------------------#
+# Exporting the catalog and importing it into an empty database must give
+# back the same rows, in either format.
+import pytest
+
+from benchmarks.data import seed_database
+from cli import FIELDS, MODELS, fyyur_cli
+from models import db
+
+
+def snapshot(kinds):
+    table_rows = {}
+    for kind in kinds:
+        table = MODELS[kind].__table__
+        columns = [table.c[name] for name in FIELDS[kind]]
+        table_rows[kind] = [tuple(row) for row in db.session.query(*columns).order_by(table.c.id)]
+    return table_rows
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'ndjson'])
+def test_export_then_import_gives_back_the_same_rows(app, tmp_path, fmt):
+    kinds = ['venues', 'artists', 'shows']
+    runner = app.test_cli_runner()
+    with app.app_context():
+        seed_database(venue_count=20, artist_count=20, show_count=50)
+        before = snapshot(kinds)
+    # Both spellings of false must survive, or the round trip proves nothing.
+    assert {row[FIELDS['venues'].index('seeking_talent')] for row in before['venues']} == {True, False}
+    assert {row[FIELDS['artists'].index('seeking_venue')] for row in before['artists']} == {True, False}
+    for kind in kinds:
+        result = runner.invoke(fyyur_cli, ['export', kind, str(tmp_path / f'{kind}.{fmt}')])
+        assert result.exit_code == 0, result.output
+    with app.app_context():
+        db.session.remove()
+        db.drop_all(bind=None)
+        db.create_all(bind=None)
+    for kind in kinds:
+        result = runner.invoke(fyyur_cli, ['import', kind, str(tmp_path / f'{kind}.{fmt}')])
+        assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert snapshot(kinds) == before
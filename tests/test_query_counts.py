@@ -0,0 +1,35 @@
+# ----------------------------------------------------------------------------#
+# Statements per listing page.
+# ----------------------------------------------------------------------------#
+# The listings must issue a fixed number of statements however many rows
+# they show: one more per row is an N+1. Runs against a scratch SQLite
+# database (see conftest.py) seeded with benchmarks/data.py.
+import pytest
+
+from benchmarks.data import seed_database
+from benchmarks.routes import QueryCounter, request
+
+LISTINGS = ['/shows', '/venues', '/artists']
+
+
+@pytest.fixture(scope='module')
+def counter():
+    return QueryCounter()
+
+
+def listing_counts(app, counter, rows):
+    with app.app_context():
+        seed_database(venue_count=rows, artist_count=rows, show_count=rows)
+    client = app.test_client()
+    counts = {}
+    for path in LISTINGS:
+        # The first request may build lazily loaded state.
+        request(client, counter, 'GET', path, None)
+        counts[path] = request(client, counter, 'GET', path, None)[1]
+    return counts
+
+
+def test_listings_issue_the_same_statements_for_10_and_200_rows(app, counter):
+    small = listing_counts(app, counter, 10)
+    large = listing_counts(app, counter, 200)
+    assert large == small
@@ -0,0 +1,106 @@
+# ----------------------------------------------------------------------------#
+# Read-replica routing.
+# ----------------------------------------------------------------------------#
+# A primary and two replicas as SQLite files, each holding one row that
+# names it, behind a small app of its own, so every response says which
+# database served it.
+import os
+import shutil
+
+import pytest
+from flask import Flask, jsonify
+
+from routing import PRIMARY_COOKIE, ReplicaRouter, RoutingSQLAlchemy, read_only
+
+
+@pytest.fixture
+def stand_ins(tmp_path):
+    urls = {}
+    for name in ('primary', 'replica_0', 'replica_1'):
+        os.makedirs(tmp_path / name)
+        urls[name] = f'sqlite:///{tmp_path / name / "db.sqlite3"}'
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=urls['primary'],
+        SQLALCHEMY_BINDS={name: urls[name] for name in ('replica_0', 'replica_1')},
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        REPLICA_READ_YOUR_WRITES=5,
+        # Checks run when the test asks for them.
+        REPLICA_HEALTH_INTERVAL=3600,
+    )
+    db = RoutingSQLAlchemy(app)
+    router = ReplicaRouter(app)
+
+    class Source(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        name = db.Column(db.String(20))
+
+    with app.app_context():
+        for name in ('primary', 'replica_0', 'replica_1'):
+            engine = db.get_engine(app, bind=None if name == 'primary' else name)
+            Source.__table__.create(engine)
+            engine.execute(Source.__table__.insert(), name=name)
+
+    def served_by():
+        return jsonify([row.name for row in Source.query.order_by(Source.id)][0])
+
+    app.add_url_rule('/read', 'read', served_by)
+    app.add_url_rule('/search', 'search', read_only(lambda: served_by()), methods=['POST'])
+    app.add_url_rule('/form', 'form', served_by, methods=['POST'])
+
+    @app.route('/write', methods=['POST'])
+    def write():
+        db.session.add(Source(name='written'))
+        db.session.commit()
+        return served_by()
+
+    app.teardown_appcontext(lambda exc: db.session.remove())
+    return app, router, tmp_path
+
+
+def served(client, method, path):
+    response = client.open(path, method=method)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_reads_go_round_robin_to_the_replicas(stand_ins):
+    app, router, tmp_path = stand_ins
+    client = app.test_client()
+    assert {served(client, 'GET', '/read') for _ in range(4)} == {'replica_0', 'replica_1'}
+
+
+def test_read_only_views_use_replicas_whatever_their_method(stand_ins):
+    app, router, tmp_path = stand_ins
+    client = app.test_client()
+    assert served(client, 'POST', '/search').startswith('replica_')
+    assert served(client, 'POST', '/form') == 'primary'
+
+
+def test_a_client_reads_its_writes_from_the_primary(stand_ins):
+    app, router, tmp_path = stand_ins
+    client = app.test_client()
+    assert served(client, 'POST', '/write') == 'primary'
+    assert served(client, 'GET', '/read') == 'primary'
+    assert served(client, 'POST', '/search') == 'primary'
+    # Once the cookie expires, or for other clients, reads use replicas.
+    client.delete_cookie('localhost', PRIMARY_COOKIE)
+    assert served(client, 'GET', '/read').startswith('replica_')
+    assert served(app.test_client(), 'GET', '/read').startswith('replica_')
+
+
+def test_reads_fail_over_to_healthy_replicas_then_the_primary(stand_ins):
+    app, router, tmp_path = stand_ins
+    client = app.test_client()
+    shutil.rmtree(tmp_path / 'replica_1')
+    router.check(app)
+    assert {served(client, 'GET', '/read') for _ in range(4)} == {'replica_0'}
+    assert not router.status()['replica_1']['healthy']
+    shutil.rmtree(tmp_path / 'replica_0')
+    router.check(app)
+    assert {served(client, 'GET', '/read') for _ in range(4)} == {'primary'}
+    # Back once a check finds it again.
+    os.makedirs(tmp_path / 'replica_0')
+    shutil.copy(tmp_path / 'primary' / 'db.sqlite3', tmp_path / 'replica_0' / 'db.sqlite3')
+    router.check(app)
+    assert router.status()['replica_0']['healthy']